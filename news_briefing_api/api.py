@@ -1,13 +1,68 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
+import base64
+import functools
+import hashlib
+import json
 import logging
+import time
 import database
-from config import DOMAIN_KEYWORDS
+import job_queue
+from metrics import API_REQUEST_SECONDS, REGISTRY
+from config import DOMAIN_KEYWORDS, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL_SECONDS
+from response_cache import ResponseCache
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 app = Flask(__name__)
 
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL_SECONDS)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    """按路由模板记录请求耗时（流式响应只统计到开始发送为止）"""
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        API_REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                    route=route, method=request.method, status=response.status_code)
+    return response
+
+# 只缓存这些状态码的响应，出错的响应每次重新计算
+_CACHEABLE_STATUS_CODES = (200, 404)
+
+def cached_response(view):
+    """按端点和查询参数缓存响应，数据版本号变化时失效，并支持强ETag和If-None-Match/304"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        generation = database.get_data_generation()
+        key = (request.path, tuple(sorted(request.args.items(multi=True))))
+        cached = response_cache.get(key, generation) if generation is not None else None
+        if cached is None:
+            response = app.make_response(view(*args, **kwargs))
+            if generation is None or response.status_code not in _CACHEABLE_STATUS_CODES:
+                return response
+            body = response.get_data()
+            headers = [(name, value) for name, value in response.headers
+                       if name not in ('Content-Type', 'Content-Length')]
+            cached = (body, response.status_code, response.mimetype, headers, hashlib.sha256(body).hexdigest())
+            response_cache.put(key, generation, cached)
+
+        body, status, mimetype, headers, etag = cached
+        response = Response(body, status=status, mimetype=mimetype, headers=headers)
+        if status != 200:
+            return response
+        response.set_etag(etag)
+        # 客户端每次都需携带ETag重新验证，数据未变化时返回304
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+    return wrapper
+
 @app.route('/api/latest_briefing', methods=['GET'])
+@cached_response
 def get_latest():
     """API端点，获取最新简报"""
     keyword = request.args.get('keyword', None)
@@ -24,24 +79,115 @@ def get_latest():
         logging.error(f"获取最新简报时API出错: {e}")
         return jsonify({"error": "内部服务器错误"}), 500
 
+def encode_cursor(briefing):
+    """把简报的(scrape_timestamp, id)编码为不透明的分页游标"""
+    payload = json.dumps([briefing['scrape_timestamp'], briefing['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """解析分页游标，空游标表示从最新一条开始；格式无效时抛出ValueError"""
+    if not cursor:
+        return database.CURSOR_START
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, briefing_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError(f"无效的游标: {cursor}")
+    if not isinstance(timestamp, str) or not isinstance(briefing_id, int):
+        raise ValueError(f"无效的游标: {cursor}")
+    return timestamp, briefing_id
+
 @app.route('/api/briefings', methods=['GET'])
+@cached_response
 def get_multiple_briefings():
-    """API端点，获取多个最新简报"""
+    """API端点，获取多个最新简报。
+
+    传入cursor参数（首页可为空）时按时间键集分页，若还有下一页，
+    响应头X-Next-Cursor给出下一页的cursor。
+    """
+    cursor = request.args.get('cursor', None)
+    try:
+        before = decode_cursor(cursor) if cursor is not None else None
+    except ValueError:
+        return jsonify({"error": "无效的cursor参数。"}), 400
+
     try:
         limit = int(request.args.get('limit', 10))  # 默认10个简报
         keyword = request.args.get('keyword', None)
         category = request.args.get('category', None)
-        if limit > 50:  # 安全限制
-            limit = 50
-        briefings = database.get_latest_briefings(limit=limit, keyword=keyword, category=category)
-        return jsonify(briefings)
+        # 安全限制：限制在1到50之间，0或负数会变成SQLite的LIMIT -1，返回整个表
+        limit = max(1, min(limit, 50))
+        briefings = database.get_latest_briefings(limit=limit, keyword=keyword, category=category, before=before)
+        response = jsonify(briefings)
+        # 按时间排序的结果才能继续翻页（关键词搜索不带cursor时按相关度排序）
+        time_ordered = before is not None or not keyword
+        if time_ordered and briefings and len(briefings) == limit:
+            response.headers['X-Next-Cursor'] = encode_cursor(briefings[-1])
+        return response
     except ValueError:
         return jsonify({"error": "无效的limit参数。必须是整数。"}), 400
     except Exception as e:
         logging.error(f"获取多个简报时API出错: {e}")
         return jsonify({"error": "内部服务器错误"}), 500
 
+@app.route('/api/export', methods=['GET'])
+def export_briefings():
+    """API端点，以NDJSON流式导出简报，适合全量和增量同步。
+
+    参数：since（整数表示id，否则为时间戳）、category、fields（逗号分隔的列名）。
+    """
+    since = request.args.get('since', None)
+    if since is not None and since.isdigit():
+        since = int(since)
+    category = request.args.get('category', None)
+
+    fields = None
+    if request.args.get('fields'):
+        fields = [field.strip() for field in request.args['fields'].split(',') if field.strip()]
+        unknown = [field for field in fields if field not in database.LISTING_COLUMNS]
+        if unknown:
+            return jsonify({"error": f"无效的fields参数: {','.join(unknown)}"}), 400
+
+    def generate():
+        try:
+            for briefing in database.iter_briefings(since=since, category=category, fields=fields):
+                yield json.dumps(briefing, ensure_ascii=False) + "\n"
+        except Exception as e:
+            # 响应头已经发出，只能记录错误并提前结束数据流
+            logging.error(f"导出简报时API出错: {e}")
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/briefings/<int:briefing_id>/raw', methods=['GET'])
+def get_briefing_raw_content(briefing_id):
+    """API端点，获取单个简报爬取时保存的原始HTML"""
+    try:
+        raw_content = database.get_raw_content(briefing_id)
+        if raw_content is None:
+            return jsonify({"message": "未找到该简报的原始内容。"}), 404
+        # 以纯文本返回，避免第三方页面中的脚本在API域名下执行
+        response = Response(raw_content, mimetype='text/plain')
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        return response
+    except Exception as e:
+        logging.error(f"获取简报原始内容时API出错: {e}")
+        return jsonify({"error": "内部服务器错误"}), 500
+
+@app.route('/api/briefings/<int:briefing_id>/duplicates', methods=['GET'])
+@cached_response
+def get_briefing_duplicates(briefing_id):
+    """API端点，获取归并到该简报下的其他来源的近似重复文章"""
+    try:
+        duplicates = database.get_duplicates(briefing_id)
+        if duplicates is None:
+            return jsonify({"message": "未找到该简报。"}), 404
+        return jsonify({"duplicates": duplicates})
+    except Exception as e:
+        logging.error(f"获取近似重复文章时API出错: {e}")
+        return jsonify({"error": "内部服务器错误"}), 500
+
 @app.route('/api/categories', methods=['GET'])
+@cached_response
 def get_categories():
     """API端点，获取所有可用的类别"""
     try:
@@ -52,6 +198,58 @@ def get_categories():
         logging.error(f"获取类别时API出错: {e}")
         return jsonify({"error": "内部服务器错误"}), 500
 
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """API端点，创建爬取任务，由worker进程领取执行。
+
+    请求体（可选）：{"sites": ["站点名", ...]}，默认爬取所有站点。
+    已在队列中或正在爬取的站点不会重复加入。
+    """
+    payload = request.get_json(silent=True) or {}
+    sites = payload.get('sites')
+    if sites is not None and (not isinstance(sites, list) or not all(isinstance(site, str) for site in sites)):
+        return jsonify({"error": "sites必须是站点名列表。"}), 400
+    try:
+        job_id, skipped = job_queue.enqueue_crawl_job(sites or None, trigger='api')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"创建爬取任务时API出错: {e}")
+        return jsonify({"error": "内部服务器错误"}), 500
+    if job_id is None:
+        return jsonify({"message": "所选站点都已在队列中或正在爬取。", "skipped_sites": skipped}), 409
+    return jsonify({"job": database.get_crawl_job(job_id), "skipped_sites": skipped}), 202
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """API端点，获取最近的爬取任务"""
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), 100))
+    except ValueError:
+        return jsonify({"error": "无效的limit参数。必须是整数。"}), 400
+    try:
+        return jsonify({"jobs": database.get_crawl_jobs(limit)})
+    except Exception as e:
+        logging.error(f"获取爬取任务时API出错: {e}")
+        return jsonify({"error": "内部服务器错误"}), 500
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    """API端点，获取单个爬取任务及其各站点任务的状态"""
+    try:
+        job = database.get_crawl_job(job_id)
+        if job is None:
+            return jsonify({"message": "未找到该爬取任务。"}), 404
+        return jsonify(job)
+    except Exception as e:
+        logging.error(f"获取爬取任务时API出错: {e}")
+        return jsonify({"error": "内部服务器错误"}), 500
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """以Prometheus文本格式输出本进程的指标"""
+    return Response(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 def run_api(host='0.0.0.0', port=5000, debug=False):
     """运行Flask开发服务器"""
     # 生产环境应使用Gunicorn或uWSGI等适当的WSGI服务器
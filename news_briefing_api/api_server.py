@@ -0,0 +1,35 @@
+"""只运行API服务的入口。
+
+不导入爬虫和NLP相关的模块，启动时只初始化数据库，适合部署多个API副本：
+    python api_server.py --port 5000
+    gunicorn -w 4 -b 0.0.0.0:5000 "api_server:create_app()"
+爬取任务由worker.py在单独的进程中运行。
+"""
+import argparse
+import logging
+import sys
+
+import database
+import api
+
+def create_app():
+    """初始化数据库（已是最新版本时不做任何修改）并返回Flask应用"""
+    database.init_db()
+    return api.app
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="只运行API服务，不运行爬取任务")
+    parser.add_argument('--host', default='0.0.0.0', help="监听地址")
+    parser.add_argument('--port', type=int, default=5000, help="监听端口")
+    args = parser.parse_args(argv)
+
+    try:
+        create_app()
+    except Exception as e:
+        logging.critical(f"初始化数据库失败: {e}. 退出。")
+        return 1
+    api.run_api(host=args.host, port=args.port, debug=False)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from config import POST_CRAWL_SELECTORS, BACKFILL_BATCH_SIZE, BACKFILL_WORKERS, DEDUP_MIN_CHARS
+import database
+import nlp_processor
+from extractors import parse_content
+from simhash import simhash
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 来源站点不在POST_CRAWL_SELECTORS中时使用的选择器，只取正文段落
+DEFAULT_SELECTORS = {'title': 'title', 'date': 'time', 'content_placeholder': 'body'}
+
+def extract_text(row):
+    """从简报保存的原始HTML中提取正文段落。
+
+    没有原始HTML或正文选择器匹配不到内容时返回空字符串，这类简报保持原样，
+    不能只凭标题覆盖入库时根据整页内容生成的摘要、关键词和类别。
+    """
+    html_content = database._decompress(row.get('compression'), row.get('content'))
+    if not html_content:
+        return ""
+    site_config = POST_CRAWL_SELECTORS.get(row.get('source_site'), {})
+    parsed_data = parse_content(html_content, site_config.get('selectors', DEFAULT_SELECTORS))
+    return parsed_data.get('cleaned_content') or ""
+
+def process_batch(rows, category_only=False):
+    """在子进程中处理一批简报，返回[(id, NLP结果), ...]。
+
+    category_only为True时只根据正文和已保存的关键词重新分类，跳过摘要和关键词提取；
+    否则同时重新计算正文的SimHash指纹。提取不到正文的简报不出现在结果中，保持原样。
+    """
+    results = []
+    for row in rows:
+        try:
+            text = extract_text(row)
+            if not text:
+                continue
+            if category_only:
+                keywords = row['keywords'].split(',') if row.get('keywords') else []
+                results.append((row['id'], {'category': nlp_processor.categorize_content(text, keywords)}))
+            else:
+                result = nlp_processor.process_text(text)
+                # 顺便补上正文指纹，旧简报也能参与近似重复检测
+                result['simhash'] = simhash(text) if len(text) >= DEDUP_MIN_CHARS else None
+                results.append((row['id'], result))
+        except Exception as e:
+            logging.error(f"回填简报{row['id']}时出错: {e}")
+    return results
+
+def run_backfill(category_only=False, restart=False, batch_size=BACKFILL_BATCH_SIZE, workers=BACKFILL_WORKERS):
+    """用当前的NLP配置重新处理已保存的简报。
+
+    按id顺序分批读取，批次在进程池中并行处理，结果按原顺序逐批写回；
+    每批写回和检查点在同一个事务中提交，中断后再次运行会从检查点继续。
+    全部完成后删除检查点，下次运行重新从头处理。返回本次更新的简报数。
+    提取不到正文的简报保持原样，不计入已处理数。
+    """
+    name = 'category' if category_only else 'full'
+    if restart:
+        database.clear_backfill_checkpoint(name)
+    last_id, processed = database.get_backfill_checkpoint(name)
+    remaining = database.count_briefings_after(last_id)
+    workers = workers or os.cpu_count() or 1
+    if last_id:
+        logging.info(f"从检查点继续回填（模式: {name}）：已处理{processed}条，上次处理到id {last_id}。")
+    logging.info(f"开始回填（模式: {name}）：待处理{remaining}条，进程数{workers}，每批{batch_size}条。")
+
+    start_time = time.monotonic()
+    done = 0
+    updated = 0
+    # 进行中的批次数有上限，内存占用与总行数无关
+    max_pending = workers * 2
+    pending = deque()
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def commit_oldest():
+        nonlocal last_id, processed, done, updated
+        batch_last_id, batch_size_done, future = pending.popleft()
+        results = future.result()
+        # 检查点记录读取位置，已处理数只统计实际更新的简报
+        processed += len(results)
+        database.save_backfill_results(name, results, batch_last_id, processed, category_only)
+        last_id = batch_last_id
+        done += batch_size_done
+        updated += len(results)
+        elapsed = time.monotonic() - start_time
+        logging.info(f"回填进度: {done}/{remaining}，已更新{updated}条，{done / elapsed:.1f}条/秒。")
+
+    try:
+        for batch in database.iter_backfill_batches(last_id, batch_size):
+            pending.append((batch[-1]['id'], len(batch), executor.submit(process_batch, batch, category_only)))
+            if len(pending) >= max_pending:
+                commit_oldest()
+        while pending:
+            commit_oldest()
+    except KeyboardInterrupt:
+        logging.warning(f"回填被中断，已处理到id {last_id}，再次运行将从这里继续。")
+        raise
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    database.clear_backfill_checkpoint(name)
+    if done > updated:
+        logging.warning(f"{done - updated}条简报提取不到正文（原始HTML缺失、正文选择器不匹配或处理出错），保持原样。")
+    logging.info(f"回填完成（模式: {name}）：本次读取{done}条，更新{updated}条，用时{time.monotonic() - start_time:.1f}秒。")
+    return updated
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="用当前的NLP配置重新生成已保存简报的摘要、关键词和类别")
+    parser.add_argument('--category-only', action='store_true', help="只重新分类，跳过摘要和关键词提取")
+    parser.add_argument('--restart', action='store_true', help="忽略检查点，从头开始")
+    parser.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE, help="每批处理的简报数")
+    parser.add_argument('--workers', type=int, default=BACKFILL_WORKERS, help="进程数，默认使用CPU核心数")
+    args = parser.parse_args()
+
+    database.init_db()
+    run_backfill(args.category_only, args.restart, args.batch_size, args.workers)
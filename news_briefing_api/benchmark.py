@@ -0,0 +1,505 @@
+"""离线性能基准测试。
+
+不访问网络：页面解析和NLP使用fixtures/pages下按各站点结构录制的样例页面，
+端到端爬取使用FakeCrawler代替AsyncWebCrawler，数据库测试使用临时目录中生成的数据库。
+结果写入JSON文件，传入--baseline时与之前的结果逐项比较。缺少NLTK分词数据时不会下载，英文摘要按缺少数据处理。
+
+用法：
+    python benchmark.py                                  # 运行全部基准，结果写入数据目录下的benchmark_results.json
+    python benchmark.py --only parse,nlp --sizes 1000    # 只运行部分基准
+    python benchmark.py --baseline old.json --fail-threshold 0.2
+"""
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+import platform
+import queue
+import random
+import re
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from bs4 import BeautifulSoup
+
+from config import POST_CRAWL_SELECTORS, DOMAIN_KEYWORDS, DB_READ_POOL_SIZE
+import database
+import extractors
+
+SUITES = ('parse', 'nlp', 'db', 'api', 'crawl')
+DEFAULT_SIZES = (1000, 100000, 1000000)
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), 'news_briefing_benchmark')
+
+_TAG = re.compile(r'<[^>]+>')
+_WORD = re.compile(r'[A-Za-z]{3,}|[一-鿿]')
+
+# --- 样例语料 ---
+
+def load_corpus():
+    """读取样例页面，返回[(站点名, HTML内容, 正文文本), ...]"""
+    corpus = []
+    for site_key, _, html_content in extractors.iter_fixture_pages():
+        parsed = extractors.BeautifulSoupExtractor(POST_CRAWL_SELECTORS[site_key]['selectors']).extract(html_content)
+        corpus.append((site_key, html_content, parsed.get('cleaned_content') or ""))
+    return corpus
+
+def corpus_vocabulary(corpus):
+    """样例正文中的词语，用于生成合成数据"""
+    words = []
+    for _, _, text in corpus:
+        words.extend(_WORD.findall(text))
+    return words or ['news']
+
+def split_vocabulary(vocabulary):
+    """把词语分为可以使用FTS5全文索引的关键词（至少3个字符）和只能按子串匹配的短关键词"""
+    long_words = [word for word in vocabulary if len(word) >= 3] or ['news']
+    short_words = [word for word in vocabulary if len(word) < 3] or ['糖']
+    return long_words, short_words
+
+def disable_nltk_download():
+    """基准测试不访问网络：缺少NLTK数据时不下载，英文摘要按缺少数据处理。
+
+    也用作爬取基准中NLP进程池的初始化函数，子进程重新导入config后同样不会下载。
+    """
+    import nlp_processor
+    nlp_processor.NLTK_AUTO_DOWNLOAD = False
+
+def article_url(site_config, index):
+    """生成匹配站点文章URL模式的合成文章URL"""
+    domain = site_config['allowed_domains'][0]
+    pattern = site_config.get('article_url_pattern')
+    if not pattern:
+        return f"https://{domain}/bench-{index}"
+    if pattern.startswith('.'):
+        return f"https://{domain}/bench-{index}{pattern}"
+    return f"https://{domain}/{pattern.strip('/')}/bench-{index}"
+
+def article_variant(html_content, content_selector, rng, vocabulary, index):
+    """在样例页面的正文区域末尾加入一段随机文字，使各篇文章的正文互不重复（不会被近似重复检测归并）"""
+    soup = BeautifulSoup(html_content, 'html.parser')
+    content_area = soup.select_one(content_selector) or soup.body or soup
+    paragraph = soup.new_tag('p')
+    paragraph.string = f"{index} " + " ".join(rng.choice(vocabulary) for _ in range(120))
+    content_area.append(paragraph)
+    return str(soup)
+
+def build_fake_web(corpus, articles_per_site, seed=0):
+    """生成供FakeCrawler返回的页面：每个起始页链接到articles_per_site篇由该站点样例派生的文章"""
+    rng = random.Random(seed)
+    vocabulary = corpus_vocabulary(corpus)
+    samples = {}
+    for site_key, html_content, _ in corpus:
+        samples.setdefault(site_key, html_content)
+
+    pages = {}
+    for site_key, site_config in POST_CRAWL_SELECTORS.items():
+        sample = samples.get(site_key)
+        if sample is None:
+            continue
+        urls = [article_url(site_config, f"{site_key}-{i}") for i in range(articles_per_site)]
+        for i, url in enumerate(urls):
+            content_selector = site_config['selectors'].get('content_placeholder', 'body')
+            pages[url] = (article_variant(sample, content_selector, rng, vocabulary, i), [])
+        for start_url in site_config['start_urls']:
+            listing = "".join(f'<li><a href="{url}">{url}</a></li>' for url in urls)
+            pages[start_url] = (f"<html><body><ul>{listing}</ul></body></html>", urls)
+    return pages
+
+class FakeCrawler:
+    """代替crawl4ai.AsyncWebCrawler的本地爬虫，按build_fake_web()生成的页面返回结果。
+
+    latency为每次抓取模拟的网络和渲染耗时（秒）。
+    """
+
+    def __init__(self, pages, latency=0.0, config=None):
+        self.pages = pages
+        self.latency = latency
+        self.calls = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+    async def arun(self, url, config=None):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        page = self.pages.get(url)
+        if page is None:
+            return SimpleNamespace(url=url, success=False, error_message="404 Not Found", html="",
+                                   links={}, markdown=SimpleNamespace(raw_markdown=""))
+        html_content, links = page
+        return SimpleNamespace(
+            url=url, success=True, error_message="", html=html_content,
+            links={'internal': [{'href': link} for link in links], 'external': []},
+            markdown=SimpleNamespace(raw_markdown=_TAG.sub(" ", html_content))
+        )
+
+# --- 计时与统计 ---
+
+def summarize(samples, unit_count=None):
+    """把每次调用的耗时（秒）汇总为中位数、P95等统计值"""
+    samples = sorted(samples)
+    total = sum(samples)
+    return {
+        'n': len(samples),
+        'mean_ms': round(total / len(samples) * 1000, 4),
+        'median_ms': round(statistics.median(samples) * 1000, 4),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 4),
+        'ops_per_sec': round((unit_count or len(samples)) / total, 2) if total else None
+    }
+
+def measure(func, items, repeat=1, warmup=1):
+    """对items中的每一项调用func，返回每次调用耗时的统计"""
+    for item in items[:warmup]:
+        func(item)
+    samples = []
+    for _ in range(repeat):
+        for item in items:
+            start = time.perf_counter()
+            func(item)
+            samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+# --- 基准：解析和NLP ---
+
+def bench_parse(corpus, repeat):
+    results = {}
+    pages = [(POST_CRAWL_SELECTORS[site_key]['selectors'], html_content) for site_key, html_content, _ in corpus]
+    import scheduler
+    results['parse.parse_content_with_bs'] = measure(
+        lambda page: scheduler.parse_content_with_bs(page[1], page[0]), pages, repeat)
+    for backend in extractors.BACKENDS:
+        results[f'parse.extractor.{backend}'] = measure(
+            lambda page: extractors.get_extractor(page[0], backend).extract(page[1]), pages, repeat)
+    return results
+
+def bench_nlp(corpus, repeat):
+    import nlp_processor
+    texts = [text for _, _, text in corpus if text]
+    # 再加几篇长文，覆盖NLP_MAX_INPUT_CHARS截断的情况
+    texts += [" ".join(texts) * 10, "\n".join(reversed(texts)) * 10]
+    return {
+        'nlp.process_text': measure(nlp_processor.process_text, texts, repeat),
+        'nlp.categorize_content': measure(nlp_processor.categorize_content, texts, repeat * 20),
+    }
+
+# --- 基准：数据库 ---
+
+def use_database(path):
+    """让database模块改用指定的数据库文件（只在基准测试中使用）"""
+    database.close_db_connection()
+    while True:
+        try:
+            database._read_pool.get_nowait().close()
+        except queue.Empty:
+            break
+    database.DB_NAME = path
+    database._read_pool = queue.LifoQueue(maxsize=DB_READ_POOL_SIZE)
+    database._fts_available = None
+
+SYNTHETIC_START = datetime(2020, 1, 1)
+
+def synthetic_rows(count, start_id, rng, vocabulary):
+    """生成count条合成简报，爬取时间按id递增"""
+    categories = list(DOMAIN_KEYWORDS) + [""]
+    keywords = [keyword for words in DOMAIN_KEYWORDS.values() for keyword in words]
+    for row_id in range(start_id, start_id + count):
+        title = " ".join(rng.choice(vocabulary) for _ in range(8))
+        summary = " ".join(rng.choice(vocabulary) for _ in range(40))
+        yield (
+            title, f"https://bench.example/{row_id}", "2024-01-01",
+            (SYNTHETIC_START + timedelta(minutes=row_id)).strftime('%Y-%m-%d %H:%M:%S'),
+            summary, ",".join(rng.sample(keywords, 5)), rng.choice(list(POST_CRAWL_SELECTORS)),
+            rng.choice(categories)
+        )
+
+def prepare_database(path, rows, vocabulary, batch_size=10000):
+    """生成包含rows条简报的数据库，已存在且行数一致时直接复用"""
+    if os.path.exists(path):
+        conn = sqlite3.connect(path)
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            count = conn.execute("SELECT COUNT(*) FROM briefings").fetchone()[0]
+        except sqlite3.Error:
+            version, count = None, None
+        conn.close()
+        if version == len(database.MIGRATIONS) and count == rows:
+            use_database(path)
+            return 0.0
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    use_database(path)
+    start = time.perf_counter()
+    database.init_db()
+    rng = random.Random(rows)
+    conn = database.get_db_connection()
+    generated = synthetic_rows(rows, 1, rng, vocabulary)
+    while True:
+        batch = [row for _, row in zip(range(batch_size), generated)]
+        if not batch:
+            break
+        with conn:
+            conn.executemany('''
+                INSERT INTO briefings(title, source_url, publication_date, scrape_timestamp,
+                                      summary, keywords, source_site, category)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', batch)
+    conn.execute("PRAGMA optimize")
+    return time.perf_counter() - start
+
+def bench_database(sizes, data_dir, vocabulary, repeat):
+    results = {}
+    rng = random.Random(1)
+    categories = list(DOMAIN_KEYWORDS)
+    long_words, short_words = split_vocabulary(vocabulary)
+    for size in sizes:
+        path = os.path.join(data_dir, f"briefings-{size}.db")
+        build_seconds = prepare_database(path, size, vocabulary)
+        if build_seconds:
+            logging.warning(f"已生成{size}行的基准数据库，用时{build_seconds:.1f}秒。")
+        prefix = f"db.{size}"
+        # 从中间位置翻页，对应深翻页的游标
+        middle = ((SYNTHETIC_START + timedelta(minutes=size // 2)).strftime('%Y-%m-%d %H:%M:%S'), size // 2)
+        queries = {
+            'latest': lambda _: database.get_latest_briefings(limit=1),
+            'page': lambda _: database.get_latest_briefings(limit=10),
+            'category': lambda _: database.get_latest_briefings(limit=10, category=rng.choice(categories)),
+            'keyword_fts': lambda _: database.get_latest_briefings(limit=10, keyword=rng.choice(long_words)),
+            # 不足3个字符的关键词无法使用全文索引，按子串匹配
+            'keyword_short': lambda _: database.get_latest_briefings(limit=10, keyword=rng.choice(short_words)),
+            'cursor_deep': lambda _: database.get_latest_briefings(limit=10, before=middle),
+        }
+        for name, query in queries.items():
+            results[f"{prefix}.get_latest_briefings.{name}"] = measure(query, list(range(50)), repeat)
+
+        counter = iter(range(10 ** 9))
+        def add_one(_):
+            index = next(counter)
+            database.add_briefing({
+                'title': f"benchmark {index}", 'source_url': f"https://bench.example/add/{size}/{time.time_ns()}-{index}",
+                'publication_date': "2024-01-01", 'raw_content': "<p>benchmark</p>" * 50,
+                'summary': "benchmark summary", 'keywords': ["benchmark"], 'source_site': "bench", 'category': ""
+            })
+        results[f"{prefix}.add_briefing"] = measure(add_one, list(range(50)), 1)
+        # 恢复原有行数，下次运行可以直接复用数据库
+        conn = database.get_db_connection()
+        with conn:
+            conn.execute("DELETE FROM briefings WHERE source_url LIKE 'https://bench.example/add/%'")
+    return results
+
+# --- 基准：API并发负载 ---
+
+def bench_api(data_dir, size, vocabulary, requests_per_endpoint, concurrency):
+    import requests
+    from werkzeug.serving import make_server
+    import api
+    from response_cache import ResponseCache
+
+    prepare_database(os.path.join(data_dir, f"briefings-{size}.db"), size, vocabulary)
+    server = make_server('127.0.0.1', 0, api.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    rng = random.Random(2)
+    long_words, short_words = split_vocabulary(vocabulary)
+    endpoints = {
+        'latest_briefing': lambda: "/api/latest_briefing",
+        'briefings': lambda: "/api/briefings?limit=10",
+        'briefings_category': lambda: f"/api/briefings?limit=10&category={rng.choice(list(DOMAIN_KEYWORDS))}",
+        'briefings_keyword': lambda: f"/api/briefings?limit=10&keyword={rng.choice(long_words)}",
+        'briefings_keyword_short': lambda: f"/api/briefings?limit=10&keyword={rng.choice(short_words)}",
+        'categories': lambda: "/api/categories",
+    }
+    session_local = threading.local()
+
+    def get(path):
+        session = getattr(session_local, 'session', None)
+        if session is None:
+            session = session_local.session = requests.Session()
+        start = time.perf_counter()
+        response = session.get(base_url + path)
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    results = {}
+    original_cache = api.response_cache
+    try:
+        for cache_mode in ('cached', 'uncached'):
+            # 不缓存时每个请求都查询数据库，更接近数据频繁变化时的情况
+            api.response_cache = original_cache if cache_mode == 'cached' else ResponseCache(0, 0)
+            for name, make_path in endpoints.items():
+                paths = [make_path() for _ in range(requests_per_endpoint)]
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    samples = list(executor.map(get, paths))
+                elapsed = time.perf_counter() - start
+                stats = summarize(samples)
+                stats['requests_per_sec'] = round(len(samples) / elapsed, 2)
+                stats['concurrency'] = concurrency
+                results[f"api.{size}.{cache_mode}.{name}"] = stats
+    finally:
+        api.response_cache = original_cache
+        server.shutdown()
+    return results
+
+# --- 基准：端到端爬取 ---
+
+def bench_crawl(corpus, data_dir, articles_per_site, pages_per_site, latency):
+    import pipeline
+    import scheduler
+    path = os.path.join(data_dir, "crawl.db")
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    use_database(path)
+    database.init_db()
+
+    pages = build_fake_web(corpus, articles_per_site)
+    crawlers = []
+    def make_crawler(config=None):
+        crawler = FakeCrawler(pages, latency)
+        crawlers.append(crawler)
+        return crawler
+
+    originals = (scheduler.AsyncWebCrawler, scheduler.CONDITIONAL_FETCH_ENABLED,
+                 scheduler.CrawlSession, scheduler.crawl_site, pipeline.ProcessPoolExecutor)
+    scheduler.AsyncWebCrawler = make_crawler
+    scheduler.CONDITIONAL_FETCH_ENABLED = False  # 条件请求需要访问网络
+    scheduler.CrawlSession = functools.partial(originals[2], host_delay=0)
+    scheduler.crawl_site = functools.partial(originals[3], max_pages=pages_per_site)
+    pipeline.ProcessPoolExecutor = functools.partial(originals[4], initializer=disable_nltk_download)
+    try:
+        start = time.perf_counter()
+        site_counts, _ = asyncio.run(scheduler.run_crawl_job_async())
+        elapsed = time.perf_counter() - start
+    finally:
+        (scheduler.AsyncWebCrawler, scheduler.CONDITIONAL_FETCH_ENABLED,
+         scheduler.CrawlSession, scheduler.crawl_site, pipeline.ProcessPoolExecutor) = originals
+
+    fetched = sum(crawler.calls for crawler in crawlers)
+    added = sum(counts[1] for counts in site_counts.values())
+    with database.get_read_connection() as conn:
+        # 合成文章互不重复，这里不为0说明合成数据没有改动到正文
+        merged = conn.execute("SELECT COUNT(*) FROM briefing_duplicates").fetchone()[0]
+    return {'crawl.end_to_end': {
+        'n': fetched,
+        'seconds': round(elapsed, 3),
+        'pages_per_sec': round(fetched / elapsed, 2),
+        'added': added,
+        'merged_duplicates': merged,
+        'fetch_latency_ms': latency * 1000,
+        'stage_timings': database.get_crawl_job_stats(limit=1)[0]['stage_timings'],
+    }}
+
+# --- 结果比较 ---
+
+def primary_metric(result):
+    """用于和基线比较的指标：越小越好的毫秒数，端到端爬取用总耗时"""
+    if 'median_ms' in result:
+        return result['median_ms']
+    return result.get('seconds')
+
+def compare(results, baseline, threshold):
+    """逐项与基线比较，返回(比较表行, 退化项)"""
+    rows = []
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        current, previous = primary_metric(result), primary_metric(baseline[name])
+        if not current or not previous:
+            continue
+        ratio = current / previous
+        rows.append((name, previous, current, ratio))
+        if ratio > 1 + threshold:
+            regressions.append(name)
+    return rows, regressions
+
+def environment_info():
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="离线性能基准测试")
+    parser.add_argument('--only', default=",".join(SUITES), help=f"要运行的基准，逗号分隔，可选: {','.join(SUITES)}")
+    parser.add_argument('--sizes', default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="数据库基准的数据行数，逗号分隔")
+    parser.add_argument('--repeat', type=int, default=3, help="解析、NLP和查询基准的重复轮数")
+    parser.add_argument('--api-size', type=int, default=100000, help="API负载测试使用的数据库行数")
+    parser.add_argument('--api-requests', type=int, default=500, help="每个API端点的请求数")
+    parser.add_argument('--api-concurrency', type=int, default=8, help="API负载测试的并发客户端数")
+    parser.add_argument('--crawl-articles', type=int, default=30, help="端到端爬取中每个站点的文章数")
+    parser.add_argument('--crawl-pages', type=int, default=20, help="端到端爬取中每个站点最多抓取的页面数")
+    parser.add_argument('--fetch-latency', type=float, default=0.05, help="模拟的单页抓取耗时（秒）")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help="基准数据库所在目录，已生成的数据库会被复用")
+    parser.add_argument('--output', help="结果文件，默认为数据目录下的benchmark_results.json")
+    parser.add_argument('--baseline', help="用于比较的基线结果文件")
+    parser.add_argument('--fail-threshold', type=float, default=None,
+                        help="相对基线变慢超过该比例（例如0.2）时以非零状态退出")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    suites = [suite.strip() for suite in args.only.split(',') if suite.strip()]
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    os.makedirs(args.data_dir, exist_ok=True)
+    output = args.output or os.path.join(args.data_dir, 'benchmark_results.json')
+    disable_nltk_download()
+
+    corpus = load_corpus()
+    vocabulary = corpus_vocabulary(corpus)
+    results = {}
+    if 'parse' in suites:
+        results.update(bench_parse(corpus, args.repeat))
+    if 'nlp' in suites:
+        results.update(bench_nlp(corpus, args.repeat))
+    if 'db' in suites:
+        results.update(bench_database(sizes, args.data_dir, vocabulary, args.repeat))
+    if 'api' in suites:
+        results.update(bench_api(args.data_dir, args.api_size, vocabulary, args.api_requests, args.api_concurrency))
+    if 'crawl' in suites:
+        results.update(bench_crawl(corpus, args.data_dir, args.crawl_articles, args.crawl_pages, args.fetch_latency))
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'environment': environment_info(), 'results': results}, f, ensure_ascii=False, indent=2)
+
+    for name, result in sorted(results.items()):
+        metric = primary_metric(result)
+        unit = 'ms' if 'median_ms' in result else 's'
+        print(f"{name:60s} {metric:>12.4f} {unit}")
+    print(f"结果已写入{output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        threshold = args.fail_threshold if args.fail_threshold is not None else 0.1
+        rows, regressions = compare(results, baseline, threshold)
+        print(f"\n与基线{args.baseline}比较（比值>1表示变慢）：")
+        for name, previous, current, ratio in rows:
+            flag = " <-- 变慢" if name in regressions else ""
+            print(f"{name:60s} {previous:>12.4f} -> {current:>12.4f}  x{ratio:.2f}{flag}")
+        if regressions and args.fail_threshold is not None:
+            print(f"{len(regressions)}项相对基线变慢超过{threshold:.0%}。")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
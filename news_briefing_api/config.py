@@ -4,6 +4,16 @@ from dotenv import load_dotenv
 load_dotenv()
 
 DB_NAME = "briefings.db"
+DB_BUSY_TIMEOUT_SECONDS = 10         # 数据库被锁定时的等待时间
+DB_CACHE_SIZE_KB = 64000             # 每个连接的页缓存大小（KB）
+DB_MMAP_SIZE_BYTES = 256 * 1024 * 1024  # 内存映射读取的大小
+DB_READ_POOL_SIZE = 8                # API只读连接池大小
+SEARCH_RECENCY_WEIGHT_PER_DAY = 0.1  # 关键词搜索排序时每早一天的降权（与bm25相关度得分相加）
+
+# --- API设置 ---
+RESPONSE_CACHE_MAX_ENTRIES = 512     # API响应缓存的最大条目数
+RESPONSE_CACHE_TTL_SECONDS = 300     # API响应缓存的最长保留时间（秒），数据更新时会立即失效
+EXPORT_BATCH_SIZE = 500              # 流式导出时每批从数据库读取的行数
 
 # --- 爬取目标网站配置 ---
 POST_CRAWL_SELECTORS = {
@@ -174,9 +184,70 @@ POST_CRAWL_SELECTORS = {
 # --- NLP设置 ---
 SUMMARY_SENTENCE_COUNT = 5  # 摘要句子数量
 KEYWORD_COUNT = 10          # 提取关键词数量
+CATEGORY_MULTI_LABEL_RATIO = 0.5  # 多标签分类时，命中数达到最高命中数该比例的领域都会被选中
+NLP_MAX_INPUT_CHARS = 20000  # 送入摘要和关键词提取的最大字符数
+NLP_MAX_SENTENCES = 300      # 送入LSA摘要的最大句子数
+NLP_MAX_SENTENCE_CHARS = 200 # 中文单句的最大长度，超出部分按长度切分
+KEYWORD_AUTOMATON_MIN_PATTERNS = 250  # 领域关键词达到该数量时才编译为Aho-Corasick自动机，更少时逐个子串查找更快
+NLTK_AUTO_DOWNLOAD = True    # 首次处理英文文本时若缺少NLTK分词数据则自动下载；离线部署应预先下载并设为False
 
 # --- 调度器设置 ---
-SCRAPE_INTERVAL_HOURS = 8   # 每8小时爬取一次（每天3次）
+SCRAPE_INTERVAL_HOURS = 8   # 每8小时爬取一次（每天3次）；启用自适应调度时作为新站点的初始间隔
+ADAPTIVE_SCHEDULING_ENABLED = True  # 按各站点的发布频率分别调整爬取间隔
+SITE_INTERVAL_MIN_HOURS = 1         # 单个站点的最短爬取间隔（小时）
+SITE_INTERVAL_MAX_HOURS = 72        # 单个站点的最长爬取间隔（小时）
+SCHEDULE_TARGET_ITEMS_PER_RUN = 3   # 期望每次爬取平均发现的新文章数，发布越频繁的站点间隔越短
+SCHEDULE_RATE_SMOOTHING = 0.3       # 发布速率估计的指数平滑系数，越大越偏重最近几次的结果
+SCHEDULE_JITTER_RATIO = 0.1         # 下次爬取时间的随机浮动比例，避免各站点集中在同一时刻
+SCHEDULER_POLL_MINUTES = 5          # 检查到期站点的间隔（分钟），到期的站点合并为一次爬取任务
+
+# --- 任务队列设置 ---
+JOB_LEASE_SECONDS = 300             # worker领取站点任务的租约时长（秒），运行期间每隔三分之一租约续期一次
+JOB_TASK_MAX_ATTEMPTS = 3           # 站点任务最多尝试次数（包括worker异常退出导致租约过期的情况）
+JOB_RETRY_DELAY_MINUTES = 10        # 站点任务失败后重试前的等待时间（分钟），随尝试次数线性增加
+CRAWL_URL_MAX_ATTEMPTS = 2          # 单个页面抓取失败后放回爬取队列重试，最多尝试的次数
+WORKER_MAX_SITES = 8                # 每个worker一次领取并同时爬取的站点数
+WORKER_POLL_SECONDS = 30            # 队列中没有可领取的任务时，worker再次检查的间隔（秒）
+
+# --- 爬虫并发设置 ---
+MAX_PAGES_PER_SITE = 10          # 每个站点最多访问的页面数（含起始页）
+CRAWL_MAX_DEPTH = 1              # 从起始页出发的最大链接深度，1表示只抓取起始页上的链接
+CRAWL_HOST_DELAY_SECONDS = 0.5   # 同一主机相邻两次请求之间的最小间隔（秒）
+CRAWL_CONCURRENCY_PER_SITE = 5   # 每个站点同时抓取的文章页面数
+CRAWL_CONCURRENCY_PER_DOMAIN = 5 # 每个域名同时抓取的页面数
+CRAWL_MAX_CONCURRENT_PAGES = 12  # 共享浏览器中同时打开的页面总数
+
+# --- 页面解析设置 ---
+HTML_EXTRACTOR_BACKEND = 'lxml'        # 提取标题、日期和正文的解析后端：'lxml'（需安装lxml和cssselect）或'bs4'
+
+# --- 近似重复检测设置 ---
+DEDUP_ENABLED = True                   # NLP处理之前按正文SimHash指纹检测近似重复的文章
+DEDUP_MAX_DISTANCE = 3                 # 指纹汉明距离不超过该值（64位中）视为同一篇文章
+DEDUP_MIN_CHARS = 200                  # 正文短于该字符数时不做近似重复检测，避免误判
+
+# --- 增量爬取设置 ---
+CONDITIONAL_FETCH_ENABLED = True       # 渲染起始页之前先用条件HTTP请求检查页面是否变化
+CONDITIONAL_FETCH_TIMEOUT_SECONDS = 10 # 条件请求的超时时间（秒）
+CRAWL_STATE_MAX_AGE_HOURS = 24         # 起始页即使未变化，超过该时间也重新完整渲染一次
+
+# --- 爬取队列优先级设置 ---
+FRONTIER_ARTICLE_WEIGHT = 10.0          # 链接匹配文章URL模式时的加分
+FRONTIER_POSITION_WEIGHT = 2.0          # 链接在页面中越靠前加分越多，最多加该值
+FRONTIER_FRESHNESS_WEIGHT = 3.0         # URL中日期越新加分越多，最多加该值
+FRONTIER_FRESHNESS_HALF_LIFE_DAYS = 7   # URL日期每过该天数，新鲜度加分减半
+FRONTIER_DEPTH_PENALTY = 1.0            # 链接每深一层的扣分
+
+# --- 处理流水线设置 ---
+PIPELINE_QUEUE_SIZE = 50               # 抓取、解析、NLP、入库各阶段之间队列的最大长度
+PIPELINE_PARSE_WORKERS = 2             # 同时解析HTML的协程数
+NLP_PROCESS_WORKERS = None             # NLP进程池大小，None表示使用CPU核心数
+PIPELINE_STATS_INTERVAL_SECONDS = 30   # 定期记录队列深度的间隔（秒），0表示不记录
+DB_BATCH_SIZE = 50                     # 入库阶段每批写入的简报数
+DB_FLUSH_INTERVAL_SECONDS = 10         # 入库阶段缓存结果的最长时间（秒）
+
+# --- NLP回填设置 ---
+BACKFILL_BATCH_SIZE = 200              # 回填时每批读取、处理和写回的简报数（每批提交一次并记录检查点）
+BACKFILL_WORKERS = None                # 回填进程池大小，None表示使用CPU核心数
 
 # --- 领域关键词 ---
 DOMAIN_KEYWORDS = {
@@ -1,16 +1,81 @@
 import sqlite3
 import logging
+import hashlib
+import json
+import os
+import zlib
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-from config import DB_NAME
+from config import (
+    DB_NAME, DB_BUSY_TIMEOUT_SECONDS, DB_CACHE_SIZE_KB, DB_MMAP_SIZE_BYTES, DB_READ_POOL_SIZE,
+    SEARCH_RECENCY_WEIGHT_PER_DAY, EXPORT_BATCH_SIZE
+)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def get_db_connection():
-    """建立与SQLite数据库的连接"""
-    conn = sqlite3.connect(DB_NAME)
+_thread_local = threading.local()
+_read_pool = queue.LifoQueue(maxsize=DB_READ_POOL_SIZE)
+_read_pool_pid = os.getpid()
+
+def _connect(read_only=False):
+    """建立新连接并设置性能相关的PRAGMA"""
+    if read_only:
+        conn = sqlite3.connect(f"file:{DB_NAME}?mode=ro", uri=True,
+                               timeout=DB_BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+        conn.execute("PRAGMA query_only = ON")
+    else:
+        conn = sqlite3.connect(DB_NAME, timeout=DB_BUSY_TIMEOUT_SECONDS)
+        # WAL模式下写入不会阻塞读取；该设置会持久保存在数据库文件中
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE_BYTES}")
     conn.row_factory = sqlite3.Row  # 返回类似字典的对象
     return conn
 
+def get_db_connection():
+    """返回当前线程复用的读写连接，首次调用时建立"""
+    conn = getattr(_thread_local, 'conn', None)
+    if conn is None or _thread_local.pid != os.getpid():
+        conn = _connect()
+        _thread_local.conn = conn
+        _thread_local.pid = os.getpid()
+    return conn
+
+def close_db_connection():
+    """关闭当前线程的读写连接"""
+    conn = getattr(_thread_local, 'conn', None)
+    if conn is not None and _thread_local.pid == os.getpid():
+        conn.close()
+    _thread_local.conn = None
+
+@contextmanager
+def get_read_connection():
+    """从只读连接池借用一个连接，用完后归还。
+
+    API使用只读连接：WAL模式下爬虫写入时读取不会被阻塞。
+    Flask开发服务器为每个请求新建线程，所以这里用连接池而不是线程本地连接。
+    """
+    global _read_pool, _read_pool_pid
+    if _read_pool_pid != os.getpid():
+        # fork出的子进程不能复用父进程的连接
+        _read_pool = queue.LifoQueue(maxsize=DB_READ_POOL_SIZE)
+        _read_pool_pid = os.getpid()
+    try:
+        conn = _read_pool.get_nowait()
+    except queue.Empty:
+        conn = _connect(read_only=True)
+    try:
+        yield conn
+    finally:
+        try:
+            _read_pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
 def init_db():
     """初始化数据库并创建必要的表"""
     try:
@@ -30,10 +95,300 @@ def init_db():
                 )
             ''')
             conn.commit()
+            migrate(conn)
             logging.info("数据库初始化成功。")
     except sqlite3.Error as e:
         logging.error(f"数据库初始化错误: {e}")
         raise
+    try:
+        for name, detail in check_query_plans():
+            logging.warning(f"查询'{name}'的执行计划需要全表扫描或临时排序: {detail}")
+    except sqlite3.Error as e:
+        logging.error(f"检查查询执行计划时出错: {e}")
+
+_FTS_SCHEMA = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS briefings_fts USING fts5(
+        title, summary, keywords,
+        content='briefings', content_rowid='id',
+        tokenize='trigram'
+    )
+    ''',
+    # 通过触发器保持全文索引与briefings表同步
+    '''
+    CREATE TRIGGER IF NOT EXISTS briefings_fts_insert AFTER INSERT ON briefings BEGIN
+        INSERT INTO briefings_fts(rowid, title, summary, keywords)
+        VALUES (new.id, new.title, new.summary, new.keywords);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS briefings_fts_delete AFTER DELETE ON briefings BEGIN
+        INSERT INTO briefings_fts(briefings_fts, rowid, title, summary, keywords)
+        VALUES ('delete', old.id, old.title, old.summary, old.keywords);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS briefings_fts_update AFTER UPDATE OF title, summary, keywords ON briefings BEGIN
+        INSERT INTO briefings_fts(briefings_fts, rowid, title, summary, keywords)
+        VALUES ('delete', old.id, old.title, old.summary, old.keywords);
+        INSERT INTO briefings_fts(rowid, title, summary, keywords)
+        VALUES (new.id, new.title, new.summary, new.keywords);
+    END
+    '''
+]
+
+# bm25的列权重，顺序为title, summary, keywords
+_FTS_COLUMN_WEIGHTS = (10.0, 2.0, 5.0)
+
+_fts_available = None
+
+def _init_fts(conn):
+    """创建标题、摘要和关键词的FTS5全文索引；对已有数据库会用现有数据重建索引"""
+    existed = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'briefings_fts'"
+    ).fetchone() is not None
+    try:
+        for statement in _FTS_SCHEMA:
+            conn.execute(statement)
+    except sqlite3.OperationalError as e:
+        # SQLite版本过旧（trigram分词器需要3.34+）时退回LIKE搜索
+        logging.warning(f"无法创建全文索引，关键词搜索将使用LIKE: {e}")
+        return
+    if not existed:
+        conn.execute("INSERT INTO briefings_fts(briefings_fts) VALUES ('rebuild')")
+        logging.info("已建立全文索引。")
+
+def _create_listing_indexes(conn):
+    """为列表查询添加按时间和按类别+时间排序的索引"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_briefings_scrape_timestamp "
+                 "ON briefings(scrape_timestamp DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_briefings_category_timestamp "
+                 "ON briefings(category, scrape_timestamp DESC)")
+
+def _move_raw_content(conn, batch_size=200):
+    """把原始HTML从briefings表移到单独的压缩存储表中"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS briefing_raw_content (
+            briefing_id INTEGER PRIMARY KEY REFERENCES briefings(id) ON DELETE CASCADE,
+            compression TEXT NOT NULL,
+            content BLOB NOT NULL
+        )
+    ''')
+    cursor = conn.execute("SELECT id, raw_content FROM briefings WHERE raw_content IS NOT NULL")
+    moved = 0
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        conn.executemany(
+            "INSERT OR REPLACE INTO briefing_raw_content(briefing_id, compression, content) VALUES (?, 'zlib', ?)",
+            [(row[0], _compress(row[1])) for row in rows]
+        )
+        moved += len(rows)
+    if moved:
+        conn.execute("UPDATE briefings SET raw_content = NULL WHERE raw_content IS NOT NULL")
+        logging.info(f"已将{moved}条原始HTML压缩转存，可运行VACUUM回收briefings表的空间。")
+
+def _create_meta_table(conn):
+    """创建保存数据版本号等元数据的表"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS app_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO app_meta(key, value) VALUES ('data_generation', 0)")
+
+def _create_keyset_indexes(conn):
+    """把列表索引换成包含id的(时间, id)复合索引，支持按(scrape_timestamp, id)的键集分页"""
+    conn.execute("DROP INDEX IF EXISTS idx_briefings_scrape_timestamp")
+    conn.execute("DROP INDEX IF EXISTS idx_briefings_category_timestamp")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_briefings_timestamp_id "
+                 "ON briefings(scrape_timestamp, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_briefings_category_timestamp_id "
+                 "ON briefings(category, scrape_timestamp, id)")
+
+def _create_backfill_table(conn):
+    """创建记录NLP回填进度的检查点表"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL,
+            processed INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _create_crawl_state_table(conn):
+    """创建记录起始页抓取状态的表，用于条件请求和内容哈希比较"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_state (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            content_hash TEXT,
+            links TEXT,
+            checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            rendered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _create_duplicate_tables(conn):
+    """为简报增加正文SimHash指纹列，并创建记录近似重复文章的表"""
+    conn.execute("ALTER TABLE briefings ADD COLUMN simhash INTEGER")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS briefing_duplicates (
+            source_url TEXT PRIMARY KEY,
+            canonical_url TEXT NOT NULL,
+            title TEXT,
+            source_site TEXT NOT NULL,
+            distance INTEGER,
+            scrape_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_briefing_duplicates_canonical "
+                 "ON briefing_duplicates(canonical_url)")
+
+def _create_frontier_table(conn):
+    """创建持久化的爬取队列表，爬取中断后可以从中继续"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_frontier (
+            site_key TEXT NOT NULL,
+            url TEXT NOT NULL,
+            depth INTEGER NOT NULL,
+            priority REAL NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            discovered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (site_key, url)
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_crawl_frontier_pending "
+                 "ON crawl_frontier(site_key, status, priority)")
+
+def _create_site_schedule_table(conn):
+    """创建保存各站点发布速率估计和下次爬取时间的表"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS site_schedule (
+            site_key TEXT PRIMARY KEY,
+            rate_per_hour REAL NOT NULL,
+            interval_hours REAL NOT NULL,
+            last_run_at TIMESTAMP NOT NULL,
+            next_run_at TIMESTAMP NOT NULL
+        )
+    ''')
+
+def _create_job_stats_table(conn):
+    """创建保存每次爬取任务摘要的表"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_job_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at TIMESTAMP NOT NULL,
+            finished_at TIMESTAMP NOT NULL,
+            duration_seconds REAL NOT NULL,
+            processed INTEGER NOT NULL,
+            added INTEGER NOT NULL,
+            skipped INTEGER NOT NULL,
+            site_counts TEXT,
+            stage_timings TEXT
+        )
+    ''')
+
+def _create_job_queue_tables(conn):
+    """创建爬取任务队列表：每个任务按站点拆分为子任务，由worker进程领取并以租约保持"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            trigger TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            processed INTEGER NOT NULL DEFAULT 0,
+            added INTEGER NOT NULL DEFAULT 0,
+            skipped INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_tasks (
+            job_id INTEGER NOT NULL REFERENCES crawl_jobs(id),
+            site_key TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            available_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            worker_id TEXT,
+            lease_expires_at TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            processed INTEGER NOT NULL DEFAULT 0,
+            added INTEGER NOT NULL DEFAULT 0,
+            skipped INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            PRIMARY KEY (job_id, site_key)
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_crawl_tasks_status ON crawl_tasks(status, available_at)")
+    # 抓取失败的页面放回队列重试，记录已尝试的次数
+    conn.execute("ALTER TABLE crawl_frontier ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+
+def _create_export_indexes(conn):
+    """创建(类别, id)索引，按类别和id增量导出时不必先对整个类别排序"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_briefings_category_id ON briefings(category, id)")
+
+# 数据库结构迁移，第N项把数据库从版本N-1升级到版本N，当前版本记录在PRAGMA user_version中。
+# 新的结构变更只能追加到末尾。
+MIGRATIONS = [
+    _init_fts,
+    _create_listing_indexes,
+    _move_raw_content,
+    _create_meta_table,
+    _create_keyset_indexes,
+    _create_backfill_table,
+    _create_crawl_state_table,
+    _create_duplicate_tables,
+    _create_frontier_table,
+    _create_site_schedule_table,
+    _create_job_stats_table,
+    _create_job_queue_tables,
+    _create_export_indexes,
+]
+
+def migrate(conn):
+    """依次执行尚未应用的迁移，每个迁移在单独的事务中完成。
+
+    多个进程（API副本和worker）可能同时初始化同一个数据库，所以取得写锁之后重新读取版本号，
+    已由其他进程应用的迁移直接跳过。
+    """
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= len(MIGRATIONS):
+        return  # 已是最新版本，不必获取写锁
+    while True:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= len(MIGRATIONS):
+                break
+            migration = MIGRATIONS[version]
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+        logging.info(f"数据库已迁移到版本{version + 1}（{migration.__name__}）。")
+
+def _has_fts(conn):
+    """检查数据库中是否存在全文索引（每个进程只检查一次）"""
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'briefings_fts'"
+        ).fetchone() is not None
+    return _fts_available
+
+def _fts_query(keyword):
+    """把搜索关键词转换为FTS5短语查询。
+
+    trigram分词器只能匹配至少3个字符的查询，较短的关键词（如"小麦"）返回None，由调用方改用LIKE。
+    """
+    keyword = keyword.strip()
+    if len(keyword) < 3:
+        return None
+    return '"' + keyword.replace('"', '""') + '"'
 
 def url_exists(url):
     """检查给定URL的简报是否已存在"""
@@ -46,74 +401,836 @@ def url_exists(url):
         logging.error(f"检查URL存在时出错 {url}: {e}")
         return False  # 假设不存在，以允许潜在处理
 
-def add_briefing(data):
-    """添加新简报到数据库。如果添加成功返回True，如果重复或出错返回False"""
-    sql = '''
-        INSERT INTO briefings(
-            title, source_url, publication_date, raw_content, 
-            summary, keywords, source_site, category
-        ) VALUES(?,?,?,?,?,?,?,?)
-    '''
+def iter_source_urls(batch_size=10000):
+    """逐批读取所有已存储简报以及已识别为近似重复的文章的source_url"""
+    with get_read_connection() as conn:
+        cursor = conn.execute("SELECT source_url FROM briefings UNION ALL SELECT source_url FROM briefing_duplicates")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row[0]
+
+class KnownUrlIndex:
+    """已入库URL的内存索引，每次爬取任务加载一次，用于在抓取前过滤链接。
+
+    只保存URL的64位摘要而不是URL本身，十万条记录约占几MB内存；
+    摘要冲突的概率约为 n²/2⁶⁵，在本项目的数据量下可以忽略。
+    """
+
+    def __init__(self):
+        self._digests = set()
+
+    @staticmethod
+    def _digest(url):
+        return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'big')
+
+    @classmethod
+    def load(cls):
+        """从数据库加载所有已知URL，出错时返回空索引（此时add_briefing仍会拦截重复）"""
+        index = cls()
+        try:
+            for url in iter_source_urls():
+                index.add(url)
+            logging.info(f"已加载{len(index)}个已知URL。")
+        except sqlite3.Error as e:
+            logging.error(f"加载已知URL时出错: {e}")
+        return index
+
+    def add(self, url):
+        self._digests.add(self._digest(url))
+
+    def __contains__(self, url):
+        return self._digest(url) in self._digests
+
+    def __len__(self):
+        return len(self._digests)
+
+_INSERT_BRIEFING_SQL = '''
+    INSERT INTO briefings(
+        title, source_url, publication_date,
+        summary, keywords, source_site, category, simhash
+    ) VALUES(?,?,?,?,?,?,?,?)
+    ON CONFLICT(source_url) DO NOTHING
+'''
+
+# 列表类查询返回的列，原始HTML只能通过get_raw_content按id获取
+LISTING_COLUMNS = (
+    'id', 'title', 'source_url', 'publication_date', 'scrape_timestamp',
+    'summary', 'keywords', 'source_site', 'category'
+)
+
+def _compress(text):
+    return zlib.compress(text.encode('utf-8'), 6)
+
+def _to_signed64(value):
+    """SQLite的INTEGER是有符号64位整数，无符号的指纹需要转换后才能保存"""
+    if value is None:
+        return None
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def _from_signed64(value):
+    return value + (1 << 64) if value < 0 else value
+
+def _briefing_params(data):
+    """把简报字典转换为插入语句的参数"""
+    keywords_str = ",".join(data.get('keywords', []))
+    return (
+        data.get('title'),
+        data.get('source_url'),
+        data.get('publication_date'),
+        data.get('summary'),
+        keywords_str,
+        data.get('source_site'),
+        data.get('category', ''),
+        _to_signed64(data.get('simhash'))
+    )
+
+def _ids_by_url(conn, urls, chunk_size=500):
+    """返回{source_url: id}，只包含urls中已存在于数据库的URL"""
+    ids = {}
+    for i in range(0, len(urls), chunk_size):
+        chunk = urls[i:i + chunk_size]
+        placeholders = ",".join("?" * len(chunk))
+        cursor = conn.execute(f"SELECT source_url, id FROM briefings WHERE source_url IN ({placeholders})", chunk)
+        ids.update((row[0], row[1]) for row in cursor)
+    return ids
+
+def add_briefings(rows):
+    """在单个事务中批量添加简报。
+
+    返回(已添加的行, 重复的行)两个列表；同一批中重复的URL只添加第一条。
+    整批写入失败时逐条重试，仍然失败的行不会出现在任何一个列表中。
+    """
+    rows = list(rows)
+    if not rows:
+        return [], []
+
+    inserted = []
+    duplicates = []
+    # 在获取写锁之前压缩原始HTML，缩短持锁时间
+    raw_contents = {id(row): _compress(row['raw_content']) for row in rows if row.get('raw_content')}
     try:
-        with get_db_connection() as conn:
-            keywords_str = ",".join(data.get('keywords', []))
-            conn.execute(sql, (
-                data.get('title'),
-                data.get('source_url'),
-                data.get('publication_date'),
-                data.get('raw_content'),
-                data.get('summary'),
-                keywords_str,
-                data.get('source_site'),
-                data.get('category', '')
-            ))
-            conn.commit()
-            logging.info(f"添加简报: {data.get('title', 'N/A')[:50]}...")
-            return True
-    except sqlite3.IntegrityError:
-        logging.warning(f"跳过重复简报: {data.get('source_url')}")
-        return False
+        conn = get_db_connection()
+        with conn:
+            # 立即获取写锁，保证查重和插入之间没有其他写入者
+            conn.execute("BEGIN IMMEDIATE")
+            seen = set(_ids_by_url(conn, list({row.get('source_url') for row in rows})))
+            for row in rows:
+                url = row.get('source_url')
+                if url in seen:
+                    duplicates.append(row)
+                else:
+                    seen.add(url)
+                    inserted.append(row)
+            conn.executemany(_INSERT_BRIEFING_SQL, [_briefing_params(row) for row in inserted])
+
+            with_raw = [row for row in inserted if id(row) in raw_contents]
+            if with_raw:
+                new_ids = _ids_by_url(conn, [row['source_url'] for row in with_raw])
+                conn.executemany(
+                    "INSERT INTO briefing_raw_content(briefing_id, compression, content) VALUES (?, 'zlib', ?)",
+                    [(new_ids[row['source_url']], raw_contents[id(row)]) for row in with_raw]
+                )
+            if inserted:
+                bump_data_generation(conn)
     except sqlite3.Error as e:
-        logging.error(f"添加简报时出错 {data.get('source_url')}: {e}")
-        return False
+        if len(rows) == 1:
+            logging.error(f"添加简报时出错 {rows[0].get('source_url')}: {e}")
+            return [], []
+        logging.warning(f"批量添加{len(rows)}条简报时出错，改为逐条添加: {e}")
+        inserted = []
+        duplicates = []
+        for row in rows:
+            row_inserted, row_duplicates = add_briefings([row])
+            inserted.extend(row_inserted)
+            duplicates.extend(row_duplicates)
+        return inserted, duplicates
+
+    for row in inserted:
+        logging.info(f"添加简报: {(row.get('title') or 'N/A')[:50]}...")
+    for row in duplicates:
+        logging.warning(f"跳过重复简报: {row.get('source_url')}")
+    return inserted, duplicates
 
-def get_latest_briefings(limit=1, keyword=None, category=None):
-    """获取最新简报，可选择按关键词或类别筛选"""
+def bump_data_generation(conn):
+    """在当前写事务中递增数据版本号，API响应缓存据此失效"""
+    conn.execute("UPDATE app_meta SET value = value + 1 WHERE key = 'data_generation'")
+
+def get_data_generation():
+    """返回当前数据版本号，出错时返回None"""
     try:
-        with get_db_connection() as conn:
-            query = "SELECT * FROM briefings"
-            params = []
-            conditions = []
-            
-            if keyword:
-                # 在标题、摘要和关键词中搜索
-                conditions.append("(title LIKE ? OR summary LIKE ? OR keywords LIKE ?)")
-                keyword_like = f"%{keyword}%"
-                params.extend([keyword_like, keyword_like, keyword_like])
-                
-            if category:
-                conditions.append("category = ?")
-                params.append(category)
-                
-            if conditions:
-                query += " WHERE " + " AND ".join(conditions)
-
-            query += " ORDER BY scrape_timestamp DESC LIMIT ?"
-            params.append(limit)
+        with get_read_connection() as conn:
+            row = conn.execute("SELECT value FROM app_meta WHERE key = 'data_generation'").fetchone()
+            return row[0] if row else 0
+    except sqlite3.Error as e:
+        logging.error(f"读取数据版本号时出错: {e}")
+        return None
+
+def add_briefing(data):
+    """添加新简报到数据库。如果添加成功返回True，如果重复或出错返回False"""
+    inserted, _ = add_briefings([data])
+    return bool(inserted)
+
+# 分页起点：早于该位置即包含所有简报
+CURSOR_START = ('9999-12-31 23:59:59', 2 ** 63 - 1)
+
+def _build_listing_query(limit, keyword=None, category=None, use_fts=False, before=None):
+    """构建列表查询的SQL和参数，供get_latest_briefings和执行计划检查共用"""
+    params = []
+    conditions = []
+
+    fts_query = _fts_query(keyword) if keyword and use_fts else None
+    # 分页时始终按时间排序，相关度排序只用于不分页的关键词搜索
+    rank_by_relevance = fts_query is not None and before is None
+    if fts_query:
+        columns = ", ".join(f"briefings.{column}" for column in LISTING_COLUMNS)
+        query = (f"SELECT {columns} FROM briefings_fts "
+                 "JOIN briefings ON briefings.id = briefings_fts.rowid")
+        conditions.append("briefings_fts MATCH ?")
+        params.append(fts_query)
+    else:
+        query = f"SELECT {', '.join(LISTING_COLUMNS)} FROM briefings"
+        if keyword:
+            # 在标题、摘要和关键词中搜索
+            conditions.append("(title LIKE ? OR summary LIKE ? OR keywords LIKE ?)")
+            keyword_like = f"%{keyword}%"
+            params.extend([keyword_like, keyword_like, keyword_like])
+
+    if category:
+        conditions.append("category = ?")
+        params.append(category)
+
+    if before is not None:
+        # 键集分页：只取排在游标之后的行，借助(时间, id)索引直接定位，开销与翻页深度无关
+        conditions.append("(scrape_timestamp, briefings.id) < (?, ?)")
+        params.extend(before)
 
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    if rank_by_relevance:
+        # bm25越小越相关；每早一天加上固定惩罚，使较新的简报排在前面
+        weights = ", ".join(str(weight) for weight in _FTS_COLUMN_WEIGHTS)
+        query += (f" ORDER BY bm25(briefings_fts, {weights})"
+                  " + (julianday('now') - julianday(scrape_timestamp)) * ? LIMIT ?")
+        params.extend([SEARCH_RECENCY_WEIGHT_PER_DAY, limit])
+    else:
+        query += " ORDER BY scrape_timestamp DESC, briefings.id DESC LIMIT ?"
+        params.append(limit)
+    return query, params
+
+def _build_export_query(since=None, category=None, fields=None):
+    """构建流式导出查询的SQL和参数，供iter_briefings和执行计划检查共用"""
+    columns = list(fields or LISTING_COLUMNS)
+    if 'id' not in columns:
+        columns.insert(0, 'id')  # 客户端需要id来续传
+    query = f"SELECT {', '.join(columns)} FROM briefings"
+    params = []
+    conditions = []
+    order_by = "id"
+    if isinstance(since, int):
+        conditions.append("id > ?")
+        params.append(since)
+    elif since:
+        conditions.append("scrape_timestamp > ?")
+        params.append(since)
+        order_by = "scrape_timestamp, id"
+    if category:
+        conditions.append("category = ?")
+        params.append(category)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY {order_by}"
+    return query, params
+
+# API会发出的列表和导出查询，用于执行计划检查：{查询名: (构建函数, 参数)}。
+# 不带条件的全量导出必然按id顺序读取整个表，不在检查范围内。
+_PLAN_CHECK_QUERIES = {
+    'latest': (_build_listing_query, {'limit': 10}),
+    'latest_by_category': (_build_listing_query, {'limit': 10, 'category': '健康糖'}),
+    'short_keyword': (_build_listing_query, {'limit': 10, 'keyword': '小麦'}),
+    'short_keyword_by_category': (_build_listing_query, {'limit': 10, 'keyword': '小麦', 'category': '健康糖'}),
+    'page': (_build_listing_query, {'limit': 10, 'before': ('2024-01-01 00:00:00', 1000)}),
+    'page_by_category': (_build_listing_query,
+                         {'limit': 10, 'category': '健康糖', 'before': ('2024-01-01 00:00:00', 1000)}),
+    'fts_keyword': (_build_listing_query, {'limit': 10, 'keyword': '小麦粉', 'use_fts': True}),
+    'fts_keyword_by_category': (_build_listing_query,
+                                {'limit': 10, 'keyword': '小麦粉', 'category': '健康糖', 'use_fts': True}),
+    'fts_page': (_build_listing_query,
+                 {'limit': 10, 'keyword': '小麦粉', 'use_fts': True, 'before': ('2024-01-01 00:00:00', 1000)}),
+    'fts_page_by_category': (_build_listing_query,
+                             {'limit': 10, 'keyword': '小麦粉', 'category': '健康糖', 'use_fts': True,
+                              'before': ('2024-01-01 00:00:00', 1000)}),
+    'export_since_id': (_build_export_query, {'since': 1000}),
+    'export_since_time': (_build_export_query, {'since': '2024-01-01 00:00:00'}),
+    'export_by_category': (_build_export_query, {'category': '健康糖'}),
+    'export_by_category_since_id': (_build_export_query, {'category': '健康糖', 'since': 1000}),
+    'export_by_category_since_time': (_build_export_query, {'category': '健康糖', 'since': '2024-01-01 00:00:00'}),
+}
+
+# 已确认可以接受的全表扫描和临时排序：{(查询名, 计划步骤): 原因}。
+# 只按查询名和完整的计划步骤放行，执行计划变成其他形式时仍会被报告。
+_ACCEPTED_PLAN_STEPS = {
+    ('latest', 'SCAN briefings USING INDEX idx_briefings_timestamp_id'):
+        "按(时间, id)索引倒序读取，取满LIMIT条即停止",
+    ('short_keyword', 'SCAN briefings USING INDEX idx_briefings_timestamp_id'):
+        "不足3个字符的关键词无法使用trigram全文索引，只能按时间倒序逐行做LIKE匹配，找满LIMIT条即停止；"
+        "罕见的短关键词接近全表扫描",
+    ('fts_keyword', 'USE TEMP B-TREE FOR ORDER BY'): "按相关度排序，只对全文索引匹配到的行排序",
+    ('fts_keyword_by_category', 'USE TEMP B-TREE FOR ORDER BY'): "按相关度排序，只对全文索引匹配到的行排序",
+    ('fts_page', 'USE TEMP B-TREE FOR ORDER BY'): "只对全文索引匹配到的、早于游标的行按时间排序",
+}
+
+def explain_query_plans():
+    """返回{查询名: [执行计划步骤, ...]}，数据库中没有全文索引时跳过全文搜索查询"""
+    plans = {}
+    with get_read_connection() as conn:
+        has_fts = _has_fts(conn)
+        for name, (build_query, filters) in _PLAN_CHECK_QUERIES.items():
+            if filters.get('use_fts') and not has_fts:
+                continue
+            query, params = build_query(**filters)
+            rows = conn.execute("EXPLAIN QUERY PLAN " + query, params).fetchall()
+            plans[name] = [row['detail'] for row in rows]
+    return plans
+
+def check_query_plans():
+    """检查列表和导出查询是否出现对briefings表的扫描（包括按索引顺序的整表扫描）或临时B树排序，
+    返回[(查询名, 计划步骤), ...]，_ACCEPTED_PLAN_STEPS中列出的步骤除外。出错时抛出sqlite3.Error。
+    """
+    problems = []
+    for name, details in explain_query_plans().items():
+        for detail in details:
+            scans_briefings = detail == "SCAN briefings" or detail.startswith("SCAN briefings ")
+            if (scans_briefings or "TEMP B-TREE" in detail) and (name, detail) not in _ACCEPTED_PLAN_STEPS:
+                problems.append((name, detail))
+    return problems
+
+def get_latest_briefings(limit=1, keyword=None, category=None, before=None):
+    """获取最新简报，可选择按关键词或类别筛选。
+
+    按关键词搜索时使用全文索引，结果按相关度和时效综合排序；否则按爬取时间和id倒序。
+    before为(scrape_timestamp, id)游标时只返回排在其后的简报，并始终按时间排序，
+    用上一页最后一条的(scrape_timestamp, id)作为下一页的before即可逐页翻页；
+    CURSOR_START表示从最新一条开始分页。
+    """
+    try:
+        with get_read_connection() as conn:
+            query, params = _build_listing_query(limit, keyword, category, use_fts=_has_fts(conn), before=before)
             cursor = conn.execute(query, params)
-            briefings = cursor.fetchall()
-            # 将Row对象转换为标准字典并将关键词拆分回列表
-            result = []
-            for briefing in briefings:
-                briefing_dict = dict(briefing)
-                if briefing_dict.get('keywords'):
-                    briefing_dict['keywords'] = briefing_dict['keywords'].split(',')
-                else:
-                    briefing_dict['keywords'] = []
-                result.append(briefing_dict)
-            return result
+            return [_briefing_to_dict(briefing) for briefing in cursor.fetchall()]
     except sqlite3.Error as e:
         logging.error(f"获取简报时出错: {e}")
         return []  # 出错时返回空列表
 
+def _briefing_to_dict(row):
+    """将Row对象转换为标准字典并将关键词拆分回列表"""
+    briefing_dict = dict(row)
+    if 'keywords' in briefing_dict:
+        keywords = briefing_dict['keywords']
+        briefing_dict['keywords'] = keywords.split(',') if keywords else []
+    return briefing_dict
+
+def iter_briefings(since=None, category=None, fields=None, batch_size=EXPORT_BATCH_SIZE):
+    """按顺序逐批读取简报，用于流式导出，内存占用与总行数无关。
+
+    since为整数时返回id大于since的简报并按id排序；为字符串时视为时间戳，
+    返回爬取时间晚于since的简报并按(时间, id)排序。fields为要返回的列，默认LISTING_COLUMNS。
+    """
+    query, params = _build_export_query(since, category, fields)
+    with get_read_connection() as conn:
+        cursor = conn.execute(query, params)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield _briefing_to_dict(row)
+        finally:
+            cursor.close()
+
+def iter_simhashes(batch_size=10000):
+    """逐批读取已存储简报的(source_url, SimHash指纹)"""
+    with get_read_connection() as conn:
+        cursor = conn.execute("SELECT source_url, simhash FROM briefings WHERE simhash IS NOT NULL")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row[0], _from_signed64(row[1])
+
+def add_duplicates(rows):
+    """批量记录近似重复的文章，rows中每项包含source_url、canonical_url、title、source_site和distance"""
+    rows = list(rows)
+    if not rows:
+        return
+    try:
+        conn = get_db_connection()
+        with conn:
+            conn.executemany('''
+                INSERT INTO briefing_duplicates(source_url, canonical_url, title, source_site, distance)
+                VALUES (:source_url, :canonical_url, :title, :source_site, :distance)
+                ON CONFLICT(source_url) DO NOTHING
+            ''', rows)
+            bump_data_generation(conn)
+    except sqlite3.Error as e:
+        logging.error(f"记录{len(rows)}条近似重复文章时出错: {e}")
+
+def get_duplicates(briefing_id):
+    """返回归并到指定简报下的近似重复文章列表，简报不存在时返回None。
+
+    数据库出错时抛出sqlite3.Error，不能返回None，否则API会把暂时性的错误当作404缓存下来。
+    """
+    with get_read_connection() as conn:
+        row = conn.execute("SELECT source_url FROM briefings WHERE id = ?", (briefing_id,)).fetchone()
+        if row is None:
+            return None
+        rows = conn.execute('''
+            SELECT source_url, title, source_site, distance, scrape_timestamp
+            FROM briefing_duplicates WHERE canonical_url = ?
+            ORDER BY scrape_timestamp
+        ''', (row['source_url'],)).fetchall()
+        return [dict(duplicate) for duplicate in rows]
+
+def frontier_push(site_key, entries):
+    """把(url, 深度, 优先级)加入站点的爬取队列，已在队列中（包括已抓取）的URL保持不变"""
+    conn = get_db_connection()
+    with conn:
+        conn.executemany('''
+            INSERT INTO crawl_frontier(site_key, url, depth, priority) VALUES (?, ?, ?, ?)
+            ON CONFLICT(site_key, url) DO NOTHING
+        ''', [(site_key, url, depth, priority) for url, depth, priority in entries])
+
+def frontier_pop(site_key, limit):
+    """取出站点优先级最高的limit个待抓取URL并标记为抓取中，返回[(url, 深度), ...]"""
+    conn = get_db_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute('''
+            SELECT url, depth FROM crawl_frontier
+            WHERE site_key = ? AND status = 'pending'
+            ORDER BY priority DESC
+            LIMIT ?
+        ''', (site_key, limit)).fetchall()
+        conn.executemany(
+            "UPDATE crawl_frontier SET status = 'in_progress' WHERE site_key = ? AND url = ?",
+            [(site_key, row['url']) for row in rows]
+        )
+    return [(row['url'], row['depth']) for row in rows]
+
+def frontier_mark(site_key, url, status):
+    """更新队列中URL的状态：done、failed或skipped"""
+    conn = get_db_connection()
+    with conn:
+        conn.execute("UPDATE crawl_frontier SET status = ? WHERE site_key = ? AND url = ?",
+                     (status, site_key, url))
+
+def frontier_retry(site_key, url, max_attempts):
+    """记录URL抓取失败：尝试次数未达到max_attempts时放回待抓取状态，否则标记为failed。返回新状态"""
+    conn = get_db_connection()
+    with conn:
+        conn.execute('''
+            UPDATE crawl_frontier
+            SET attempts = attempts + 1,
+                status = CASE WHEN attempts + 1 < ? THEN 'pending' ELSE 'failed' END
+            WHERE site_key = ? AND url = ?
+        ''', (max_attempts, site_key, url))
+        row = conn.execute("SELECT status FROM crawl_frontier WHERE site_key = ? AND url = ?",
+                           (site_key, url)).fetchone()
+    return row['status'] if row else 'failed'
+
+def frontier_resume(site_key):
+    """把上次中断时抓取中的URL放回待抓取状态，返回(待抓取数, 已抓取数)"""
+    conn = get_db_connection()
+    with conn:
+        conn.execute("UPDATE crawl_frontier SET status = 'pending' WHERE site_key = ? AND status = 'in_progress'",
+                     (site_key,))
+        rows = conn.execute("SELECT status, COUNT(*) FROM crawl_frontier WHERE site_key = ? GROUP BY status",
+                            (site_key,)).fetchall()
+    counts = {row[0]: row[1] for row in rows}
+    return counts.get('pending', 0), counts.get('done', 0) + counts.get('failed', 0)
+
+def frontier_statuses(site_key, urls, chunk_size=500):
+    """返回{url: 状态}，只包含在站点爬取队列中的URL"""
+    urls = list(urls)
+    conn = get_db_connection()
+    statuses = {}
+    for i in range(0, len(urls), chunk_size):
+        chunk = urls[i:i + chunk_size]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT url, status FROM crawl_frontier WHERE site_key = ? AND url IN ({placeholders})",
+            [site_key] + chunk
+        ).fetchall()
+        statuses.update((row['url'], row['status']) for row in rows)
+    return statuses
+
+def frontier_contains(site_key, url):
+    """检查URL是否已在站点的爬取队列中"""
+    conn = get_db_connection()
+    row = conn.execute("SELECT 1 FROM crawl_frontier WHERE site_key = ? AND url = ?", (site_key, url)).fetchone()
+    return row is not None
+
+def frontier_clear(site_key):
+    """站点爬取完成后清空其爬取队列"""
+    conn = get_db_connection()
+    with conn:
+        conn.execute("DELETE FROM crawl_frontier WHERE site_key = ?", (site_key,))
+
+def get_site_schedules():
+    """返回{站点: 调度状态字典}"""
+    with get_read_connection() as conn:
+        rows = conn.execute(
+            "SELECT site_key, rate_per_hour, interval_hours, last_run_at, next_run_at FROM site_schedule"
+        ).fetchall()
+    return {row['site_key']: dict(row) for row in rows}
+
+# 保存站点的调度状态，与站点任务的结束状态在同一个事务中执行（见finish_crawl_task）
+_SAVE_SITE_SCHEDULE_SQL = '''
+    INSERT INTO site_schedule(site_key, rate_per_hour, interval_hours, last_run_at, next_run_at)
+    VALUES (:site_key, :rate_per_hour, :interval_hours, :last_run_at, :next_run_at)
+    ON CONFLICT(site_key) DO UPDATE SET
+        rate_per_hour = excluded.rate_per_hour,
+        interval_hours = excluded.interval_hours,
+        last_run_at = excluded.last_run_at,
+        next_run_at = excluded.next_run_at
+'''
+
+def save_crawl_job_stats(stats):
+    """保存一次爬取任务的摘要，site_counts和stage_timings以JSON保存"""
+    try:
+        conn = get_db_connection()
+        with conn:
+            conn.execute('''
+                INSERT INTO crawl_job_stats(
+                    started_at, finished_at, duration_seconds, processed, added, skipped, site_counts, stage_timings
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                stats['started_at'], stats['finished_at'], stats['duration_seconds'],
+                stats['processed'], stats['added'], stats['skipped'],
+                json.dumps(stats['site_counts'], ensure_ascii=False),
+                json.dumps(stats['stage_timings'], ensure_ascii=False)
+            ))
+    except sqlite3.Error as e:
+        logging.error(f"保存爬取任务摘要时出错: {e}")
+
+def get_crawl_job_stats(limit=20):
+    """返回最近的爬取任务摘要，按开始时间倒序"""
+    with get_read_connection() as conn:
+        rows = conn.execute("SELECT * FROM crawl_job_stats ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    result = []
+    for row in rows:
+        stats = dict(row)
+        stats['site_counts'] = json.loads(stats['site_counts'] or '{}')
+        stats['stage_timings'] = json.loads(stats['stage_timings'] or '{}')
+        result.append(stats)
+    return result
+
+# 未结束的站点任务状态
+_ACTIVE_TASK_STATUSES = ('queued', 'running')
+
+def _refresh_crawl_job(conn, job_id):
+    """根据各站点任务汇总任务的状态和计数：还有未结束的站点任务时为queued/running，
+    全部结束后至少一个站点成功为done，否则为failed"""
+    conn.execute('''
+        UPDATE crawl_jobs SET
+            processed = (SELECT COALESCE(SUM(processed), 0) FROM crawl_tasks WHERE job_id = :job_id),
+            added = (SELECT COALESCE(SUM(added), 0) FROM crawl_tasks WHERE job_id = :job_id),
+            skipped = (SELECT COALESCE(SUM(skipped), 0) FROM crawl_tasks WHERE job_id = :job_id),
+            started_at = (SELECT MIN(started_at) FROM crawl_tasks WHERE job_id = :job_id),
+            status = CASE
+                WHEN EXISTS (SELECT 1 FROM crawl_tasks WHERE job_id = :job_id AND status IN ('queued', 'running'))
+                    THEN CASE WHEN EXISTS (SELECT 1 FROM crawl_tasks WHERE job_id = :job_id AND started_at IS NOT NULL)
+                              THEN 'running' ELSE 'queued' END
+                WHEN EXISTS (SELECT 1 FROM crawl_tasks WHERE job_id = :job_id AND status = 'done') THEN 'done'
+                ELSE 'failed'
+            END,
+            finished_at = CASE
+                WHEN EXISTS (SELECT 1 FROM crawl_tasks WHERE job_id = :job_id AND status IN ('queued', 'running'))
+                    THEN NULL
+                ELSE (SELECT MAX(finished_at) FROM crawl_tasks WHERE job_id = :job_id)
+            END
+        WHERE id = :job_id
+    ''', {'job_id': job_id})
+
+def create_crawl_job(site_keys, trigger):
+    """为站点创建爬取任务，已有未结束任务的站点不重复加入。
+
+    返回(任务id, 被跳过的站点列表)；所有站点都已在队列中时任务id为None。
+    """
+    conn = get_db_connection()
+    with conn:
+        # 查重和插入在同一个写事务中，多个worker同时安排任务时不会重复加入同一站点
+        conn.execute("BEGIN IMMEDIATE")
+        active = {row[0] for row in conn.execute(
+            "SELECT DISTINCT site_key FROM crawl_tasks WHERE status IN (?, ?)", _ACTIVE_TASK_STATUSES
+        )}
+        skipped = [site_key for site_key in site_keys if site_key in active]
+        new_sites = [site_key for site_key in dict.fromkeys(site_keys) if site_key not in active]
+        if not new_sites:
+            return None, skipped
+        job_id = conn.execute("INSERT INTO crawl_jobs(trigger) VALUES (?)", (trigger,)).lastrowid
+        conn.executemany("INSERT INTO crawl_tasks(job_id, site_key) VALUES (?, ?)",
+                         [(job_id, site_key) for site_key in new_sites])
+    return job_id, skipped
+
+def claim_crawl_tasks(worker_id, limit, lease_seconds, max_attempts):
+    """领取最多limit个可运行的站点任务并加上租约，返回[{'job_id', 'site_key', 'attempts'}, ...]。
+
+    租约过期的任务（worker异常退出）重新排队，尝试次数用完的标记为failed；
+    同一站点同时只会有一个运行中的任务，因为站点的爬取队列不能被两个worker同时处理。
+    """
+    conn = get_db_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        expired = conn.execute('''
+            SELECT job_id, site_key, attempts FROM crawl_tasks
+            WHERE status = 'running' AND lease_expires_at < CURRENT_TIMESTAMP
+        ''').fetchall()
+        for row in expired:
+            logging.warning(f"任务{row['job_id']}中站点{row['site_key']}的租约已过期（第{row['attempts']}次尝试）。")
+            exhausted = row['attempts'] >= max_attempts
+            conn.execute('''
+                UPDATE crawl_tasks
+                SET status = ?, worker_id = NULL, lease_expires_at = NULL, error = ?,
+                    available_at = CURRENT_TIMESTAMP, finished_at = CASE WHEN ? THEN CURRENT_TIMESTAMP END
+                WHERE job_id = ? AND site_key = ?
+            ''', ('failed' if exhausted else 'queued', "worker租约过期", exhausted, row['job_id'], row['site_key']))
+            _refresh_crawl_job(conn, row['job_id'])
+
+        running_sites = {row[0] for row in conn.execute(
+            "SELECT site_key FROM crawl_tasks WHERE status = 'running'"
+        )}
+        candidates = conn.execute('''
+            SELECT job_id, site_key, attempts FROM crawl_tasks
+            WHERE status = 'queued' AND available_at <= CURRENT_TIMESTAMP
+            ORDER BY job_id
+        ''').fetchall()
+        claimed = []
+        for row in candidates:
+            if len(claimed) >= limit:
+                break
+            if row['site_key'] in running_sites:
+                continue
+            running_sites.add(row['site_key'])
+            conn.execute(f'''
+                UPDATE crawl_tasks
+                SET status = 'running', worker_id = ?, attempts = attempts + 1,
+                    lease_expires_at = datetime('now', '+{int(lease_seconds)} seconds'),
+                    started_at = COALESCE(started_at, CURRENT_TIMESTAMP)
+                WHERE job_id = ? AND site_key = ?
+            ''', (worker_id, row['job_id'], row['site_key']))
+            claimed.append({'job_id': row['job_id'], 'site_key': row['site_key'], 'attempts': row['attempts'] + 1})
+        for job_id in {task['job_id'] for task in claimed}:
+            _refresh_crawl_job(conn, job_id)
+    return claimed
+
+def renew_crawl_task_leases(worker_id, tasks, lease_seconds):
+    """延长worker持有的站点任务的租约，返回租约已失效（已被其他worker接管）而未能续期的任务列表"""
+    lost = []
+    conn = get_db_connection()
+    with conn:
+        for task in tasks:
+            renewed = conn.execute(f'''
+                UPDATE crawl_tasks SET lease_expires_at = datetime('now', '+{int(lease_seconds)} seconds')
+                WHERE job_id = ? AND site_key = ? AND worker_id = ? AND status = 'running'
+            ''', (task['job_id'], task['site_key'], worker_id)).rowcount
+            if not renewed:
+                lost.append(task)
+    return lost
+
+def finish_crawl_task(task, worker_id, status, counts=(0, 0, 0), error=None, retry_delay_seconds=0,
+                      schedule_state=None):
+    """结束worker持有的站点任务：status为done、failed，或queued表示在retry_delay_seconds秒后重试。
+
+    计数累加到任务上（重试时保留之前各次的计数）。schedule_state为站点新的调度状态，
+    与任务状态在同一个事务中保存，其他worker不会在两者之间看到已结束的任务和旧的下次爬取时间而重复排队。
+    租约已失效时不做修改并返回False。
+    """
+    processed, added, skipped = counts
+    conn = get_db_connection()
+    with conn:
+        updated = conn.execute(f'''
+            UPDATE crawl_tasks
+            SET status = :status, error = :error, worker_id = NULL, lease_expires_at = NULL,
+                processed = processed + :processed, added = added + :added, skipped = skipped + :skipped,
+                available_at = datetime('now', '+{int(retry_delay_seconds)} seconds'),
+                finished_at = CASE WHEN :status = 'queued' THEN NULL ELSE CURRENT_TIMESTAMP END
+            WHERE job_id = :job_id AND site_key = :site_key AND worker_id = :worker_id AND status = 'running'
+        ''', {
+            'status': status, 'error': error, 'processed': processed, 'added': added, 'skipped': skipped,
+            'job_id': task['job_id'], 'site_key': task['site_key'], 'worker_id': worker_id
+        }).rowcount
+        if updated:
+            _refresh_crawl_job(conn, task['job_id'])
+            if schedule_state is not None:
+                conn.execute(_SAVE_SITE_SCHEDULE_SQL, schedule_state)
+    return bool(updated)
+
+def get_crawl_jobs(limit=20):
+    """返回最近的爬取任务，按创建顺序倒序"""
+    with get_read_connection() as conn:
+        rows = conn.execute("SELECT * FROM crawl_jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    return [dict(row) for row in rows]
+
+def get_crawl_job(job_id):
+    """返回爬取任务及其各站点任务，不存在时返回None"""
+    with get_read_connection() as conn:
+        row = conn.execute("SELECT * FROM crawl_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        tasks = conn.execute('''
+            SELECT site_key, status, attempts, worker_id, lease_expires_at, available_at,
+                   started_at, finished_at, processed, added, skipped, error
+            FROM crawl_tasks WHERE job_id = ? ORDER BY site_key
+        ''', (job_id,)).fetchall()
+    job = dict(row)
+    job['tasks'] = [dict(task) for task in tasks]
+    return job
+
+def get_crawl_state(url):
+    """返回URL上次的抓取状态字典（links已解析为列表），没有记录时返回None"""
+    with get_read_connection() as conn:
+        row = conn.execute('''
+            SELECT url, etag, last_modified, content_hash, links, checked_at, rendered_at
+            FROM crawl_state WHERE url = ?
+        ''', (url,)).fetchone()
+    if row is None:
+        return None
+    state = dict(row)
+    state['links'] = json.loads(state['links']) if state['links'] else []
+    return state
+
+def save_crawl_state(url, etag=None, last_modified=None, content_hash=None, links=()):
+    """记录一次完整渲染后的抓取状态"""
+    conn = get_db_connection()
+    with conn:
+        conn.execute('''
+            INSERT INTO crawl_state(url, etag, last_modified, content_hash, links, checked_at, rendered_at)
+            VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+            ON CONFLICT(url) DO UPDATE SET
+                etag = excluded.etag,
+                last_modified = excluded.last_modified,
+                content_hash = excluded.content_hash,
+                links = excluded.links,
+                checked_at = excluded.checked_at,
+                rendered_at = excluded.rendered_at
+        ''', (url, etag, last_modified, content_hash, json.dumps(sorted(set(links)), ensure_ascii=False)))
+
+def touch_crawl_state(url, etag=None, last_modified=None):
+    """记录一次确认页面未变化的检查，服务器返回了新的校验头时一并更新"""
+    conn = get_db_connection()
+    with conn:
+        conn.execute('''
+            UPDATE crawl_state SET
+                etag = COALESCE(?, etag),
+                last_modified = COALESCE(?, last_modified),
+                checked_at = CURRENT_TIMESTAMP
+            WHERE url = ?
+        ''', (etag, last_modified, url))
+
+def _decompress(compression, content):
+    """还原briefing_raw_content中保存的原始HTML"""
+    if content is None:
+        return None
+    if compression == 'zlib':
+        content = zlib.decompress(content)
+    return content.decode('utf-8')
+
+def iter_backfill_batches(after_id=0, batch_size=200):
+    """按id升序逐批返回待回填的简报，每行包含id、来源站点、标题、关键词和压缩的原始HTML。
+
+    按id做键集分页，每批使用新的查询，不会长时间占用读快照。
+    """
+    while True:
+        with get_read_connection() as conn:
+            rows = conn.execute('''
+                SELECT briefings.id, source_site, title, keywords, compression, content
+                FROM briefings
+                LEFT JOIN briefing_raw_content ON briefing_raw_content.briefing_id = briefings.id
+                WHERE briefings.id > ?
+                ORDER BY briefings.id
+                LIMIT ?
+            ''', (after_id, batch_size)).fetchall()
+        if not rows:
+            return
+        batch = [dict(row) for row in rows]
+        yield batch
+        after_id = batch[-1]['id']
+
+def count_briefings_after(after_id=0):
+    """返回id大于after_id的简报数"""
+    with get_read_connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM briefings WHERE id > ?", (after_id,)).fetchone()[0]
+
+def get_backfill_checkpoint(name):
+    """返回回填任务的(last_id, processed)，没有检查点时返回(0, 0)"""
+    with get_read_connection() as conn:
+        row = conn.execute(
+            "SELECT last_id, processed FROM backfill_checkpoints WHERE name = ?", (name,)
+        ).fetchone()
+    return (row['last_id'], row['processed']) if row else (0, 0)
+
+def clear_backfill_checkpoint(name):
+    """删除回填任务的检查点，下次从头开始"""
+    conn = get_db_connection()
+    with conn:
+        conn.execute("DELETE FROM backfill_checkpoints WHERE name = ?", (name,))
+
+def save_backfill_results(name, results, last_id, processed, category_only=False):
+    """在一个事务中写回一批NLP结果并推进检查点，中断后从检查点继续不会漏行或重复写入。
+
+    results为[(id, {'summary', 'keywords', 'category', 'simhash'}), ...]；category_only为True时只更新类别。
+    """
+    if category_only:
+        sql = "UPDATE briefings SET category = ? WHERE id = ?"
+        params = [(result['category'], briefing_id) for briefing_id, result in results]
+    else:
+        sql = "UPDATE briefings SET summary = ?, keywords = ?, category = ?, simhash = ? WHERE id = ?"
+        params = [
+            (result['summary'], ",".join(result['keywords']), result['category'],
+             _to_signed64(result.get('simhash')), briefing_id)
+            for briefing_id, result in results
+        ]
+    conn = get_db_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(sql, params)
+        conn.execute('''
+            INSERT INTO backfill_checkpoints(name, last_id, processed, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(name) DO UPDATE SET
+                last_id = excluded.last_id,
+                processed = excluded.processed,
+                updated_at = excluded.updated_at
+        ''', (name, last_id, processed))
+        if params:
+            bump_data_generation(conn)
+
+def get_raw_content(briefing_id):
+    """获取指定简报的原始HTML，不存在时返回None，数据库出错时抛出sqlite3.Error"""
+    with get_read_connection() as conn:
+        row = conn.execute(
+            "SELECT compression, content FROM briefing_raw_content WHERE briefing_id = ?",
+            (briefing_id,)
+        ).fetchone()
+    if row is None:
+        return None
+    return _decompress(row['compression'], row['content'])
+
+if __name__ == "__main__":
+    # 检查列表和导出查询的执行计划，发现未列入_ACCEPTED_PLAN_STEPS的全表扫描或临时排序时返回非零状态。
+    # 默认检查config中的数据库，也可以传入其他数据库文件的路径。
+    import sys
+    if len(sys.argv) > 1:
+        DB_NAME = sys.argv[1]
+    init_db()
+    problems = check_query_plans()
+    for name, detail in problems:
+        print(f"{name}: {detail}")
+    print(f"需要全表扫描或临时排序的查询步骤数: {len(problems)}")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,211 @@
+import logging
+import os
+import sys
+import threading
+from bs4 import BeautifulSoup
+
+# lxml和cssselect是可选依赖，缺少时所有站点都使用BeautifulSoup解析
+try:
+    from lxml import etree, html as lxml_html
+    from lxml.cssselect import CSSSelector
+except ImportError:
+    etree = None
+    lxml_html = None
+    CSSSelector = None
+
+from config import HTML_EXTRACTOR_BACKEND, POST_CRAWL_SELECTORS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+FIELDS = ('title', 'publication_date', 'cleaned_content')
+
+# 目录下每个子目录以站点名命名，其中的HTML文件使用该站点的选择器解析
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'pages')
+
+class BeautifulSoupExtractor:
+    """使用BeautifulSoup和html.parser提取字段，兼容性最好，作为默认后端不可用时的后备"""
+
+    name = 'bs4'
+
+    def __init__(self, selectors):
+        self.selectors = selectors
+
+    def extract(self, html_content):
+        """从HTML内容中提取标题、发布日期和正文段落"""
+        selectors = self.selectors
+        soup = BeautifulSoup(html_content, 'html.parser')
+        data = {}
+        try:
+            title_element = soup.select_one(selectors['title'])
+            data['title'] = title_element.get_text(strip=True) if title_element else None
+        except Exception as e:
+            logging.warning(f"无法使用选择器'{selectors['title']}'提取标题: {e}")
+            data['title'] = None
+
+        try:
+            date_element = soup.select_one(selectors['date'])
+            # 尝试获取文本或特定属性，比如'datetime'（如果可用）
+            if date_element:
+                 data['publication_date'] = date_element.get('datetime') or date_element.get_text(strip=True)
+            else:
+                 data['publication_date'] = None
+        except Exception as e:
+            logging.warning(f"无法使用选择器'{selectors['date']}'提取日期: {e}")
+            data['publication_date'] = None
+
+        # 如果需要净化内容，可以使用以下代码提取正文段落
+        try:
+            content_area = soup.select_one(selectors.get('content_placeholder', 'body'))
+            if content_area:
+                 # 提取段落或相关文本
+                 texts = (p.get_text(strip=True) for p in content_area.find_all('p'))
+                 data['cleaned_content'] = "\n".join(text for text in texts if text)
+            else:
+                 data['cleaned_content'] = None
+        except Exception as e:
+             logging.warning(f"无法使用选择器'{selectors.get('content_placeholder')}'净化内容: {e}")
+             data['cleaned_content'] = None
+
+        return data
+
+class LxmlExtractor:
+    """使用lxml提取字段：选择器在构建时编译为XPath，解析和取文本都在C扩展中完成。
+
+    取文本的规则与BeautifulSoup的get_text(strip=True)一致（跳过注释、script、style和template），
+    对结构正常的页面两个后端结果相同；对p标签嵌套等不规范的HTML，两个解析器建树方式不同，结果可能不同。
+    """
+
+    name = 'lxml'
+
+    _SKIPPED_TAGS = frozenset(('script', 'style', 'template'))
+
+    def __init__(self, selectors):
+        # 选择器无效时抛出异常，由get_extractor()退回到BeautifulSoup
+        self.title = CSSSelector(selectors['title'])
+        self.date = CSSSelector(selectors['date'])
+        self.content = CSSSelector(selectors.get('content_placeholder', 'body'))
+        # BeautifulSoup不会返回template中的段落
+        self.paragraphs = etree.XPath('.//p[not(ancestor::template)]')
+        self.fallback = BeautifulSoupExtractor(selectors)
+
+    @classmethod
+    def _iter_strings(cls, element):
+        if element.tag in cls._SKIPPED_TAGS:
+            return
+        if element.text:
+            yield element.text
+        for child in element:
+            # 注释和处理指令的tag不是字符串，跳过其内容但保留其后的文本
+            if isinstance(child.tag, str):
+                yield from cls._iter_strings(child)
+            if child.tail:
+                yield child.tail
+
+    @classmethod
+    def _text(cls, element):
+        """与BeautifulSoup的get_text(strip=True)相同：各段文本去掉首尾空白后直接连接"""
+        return "".join(text.strip() for text in cls._iter_strings(element))
+
+    @staticmethod
+    def _first(selector, root):
+        matches = selector(root)
+        return matches[0] if matches else None
+
+    def extract(self, html_content):
+        """从HTML内容中提取标题、发布日期和正文段落，lxml无法解析的页面交给BeautifulSoup"""
+        try:
+            root = lxml_html.document_fromstring(html_content)
+        except Exception as e:
+            logging.debug(f"lxml无法解析页面，改用BeautifulSoup: {e}")
+            return self.fallback.extract(html_content)
+
+        data = {}
+        title_element = self._first(self.title, root)
+        data['title'] = self._text(title_element) if title_element is not None else None
+
+        date_element = self._first(self.date, root)
+        if date_element is not None:
+            data['publication_date'] = date_element.get('datetime') or self._text(date_element)
+        else:
+            data['publication_date'] = None
+
+        content_area = self._first(self.content, root)
+        if content_area is not None:
+            texts = (self._text(p) for p in self.paragraphs(content_area))
+            data['cleaned_content'] = "\n".join(text for text in texts if text)
+        else:
+            data['cleaned_content'] = None
+        return data
+
+BACKENDS = {
+    BeautifulSoupExtractor.name: BeautifulSoupExtractor,
+    LxmlExtractor.name: LxmlExtractor,
+}
+
+# 编译好的提取器按线程缓存：解析阶段在多个线程中运行，lxml的XPath对象不在线程间共享
+_thread_local = threading.local()
+
+def get_extractor(selectors, backend=HTML_EXTRACTOR_BACKEND):
+    """返回按选择器编译好的提取器，每个线程中每组选择器只编译一次。
+
+    指定的后端不可用或无法编译某个站点的选择器时，退回到BeautifulSoup。
+    """
+    cache = getattr(_thread_local, 'extractors', None)
+    if cache is None:
+        cache = _thread_local.extractors = {}
+    key = (backend, tuple(sorted(selectors.items())))
+    extractor = cache.get(key)
+    if extractor is None:
+        extractor_class = BACKENDS.get(backend, BeautifulSoupExtractor)
+        if extractor_class is LxmlExtractor and lxml_html is None:
+            extractor_class = BeautifulSoupExtractor
+        try:
+            extractor = extractor_class(selectors)
+        except Exception as e:
+            logging.warning(f"{extractor_class.name}无法编译选择器{selectors}，改用BeautifulSoup: {e}")
+            extractor = BeautifulSoupExtractor(selectors)
+        cache[key] = extractor
+    return extractor
+
+def parse_content(html_content, selectors):
+    """使用配置的后端从HTML内容中提取标题、发布日期和正文段落"""
+    return get_extractor(selectors).extract(html_content)
+
+def iter_fixture_pages(fixture_dir=FIXTURE_DIR):
+    """遍历测试页面，返回(站点名, 文件路径, HTML内容)"""
+    for site_key in sorted(os.listdir(fixture_dir)):
+        site_dir = os.path.join(fixture_dir, site_key)
+        if not os.path.isdir(site_dir):
+            continue
+        for filename in sorted(os.listdir(site_dir)):
+            if filename.endswith('.html'):
+                path = os.path.join(site_dir, filename)
+                with open(path, encoding='utf-8') as f:
+                    yield site_key, path, f.read()
+
+def check_parity(pages=None, backends=('bs4', 'lxml')):
+    """用多个后端解析同一批页面，返回结果不一致的(文件路径, 字段, {后端: 值})列表。
+
+    pages为(站点名, 文件路径, HTML内容)的序列，默认使用fixtures/pages下的页面。
+    """
+    if pages is None:
+        pages = iter_fixture_pages()
+    mismatches = []
+    for site_key, path, html_content in pages:
+        selectors = POST_CRAWL_SELECTORS[site_key]['selectors']
+        results = {backend: get_extractor(selectors, backend).extract(html_content) for backend in backends}
+        for field in FIELDS:
+            values = {backend: result.get(field) for backend, result in results.items()}
+            if len(set(values.values())) > 1:
+                mismatches.append((path, field, values))
+    return mismatches
+
+if __name__ == "__main__":
+    if lxml_html is None:
+        print("未安装lxml和cssselect，无法比较后端。")
+        sys.exit(1)
+    mismatches = check_parity()
+    for path, field, values in mismatches:
+        print(f"{path} {field}: {values}")
+    print(f"不一致的字段数: {len(mismatches)}")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,116 @@
+import logging
+import re
+from datetime import date
+
+from config import (
+    CRAWL_MAX_DEPTH, CRAWL_URL_MAX_ATTEMPTS, FRONTIER_ARTICLE_WEIGHT, FRONTIER_POSITION_WEIGHT, FRONTIER_FRESHNESS_WEIGHT,
+    FRONTIER_FRESHNESS_HALF_LIFE_DAYS, FRONTIER_DEPTH_PENALTY
+)
+import database
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SEED_PRIORITY = 1000.0
+
+# URL中的日期，例如/2024/10/18/、/2024-10-18、/20241018、/t20241018_123.html
+_URL_DATE = re.compile(r'(?<!\d)(20\d{2})[/_-]?(0[1-9]|1[0-2])(?:[/_-]?(0[1-9]|[12]\d|3[01]))?(?!\d)')
+
+def url_age_days(url, today=None):
+    """从URL中识别发布日期并返回距今的天数，识别不到时返回None"""
+    match = _URL_DATE.search(url)
+    if not match:
+        return None
+    year, month, day = int(match.group(1)), int(match.group(2)), int(match.group(3) or 1)
+    try:
+        published = date(year, month, day)
+    except ValueError:
+        return None
+    return max(((today or date.today()) - published).days, 0)
+
+def is_allowed_link(link_url, site_config):
+    """检查链接是否在站点允许的域内"""
+    return any(domain in link_url for domain in site_config['allowed_domains'])
+
+def is_article_link(link_url, site_config):
+    """检查链接是否在允许的域内并匹配文章模式"""
+    pattern = site_config.get('article_url_pattern')
+    return is_allowed_link(link_url, site_config) and (not pattern or pattern in link_url)
+
+def score_link(link_url, position, total, depth, site_config, today=None):
+    """计算链接的抓取优先级，越大越先抓取。
+
+    匹配文章URL模式的链接得分最高；在页面中越靠前的链接通常越新，得分越高；
+    URL中带日期的按新旧衰减，不带日期的取中间值；每深一层扣除固定分数。
+    """
+    priority = FRONTIER_ARTICLE_WEIGHT if is_article_link(link_url, site_config) else 0.0
+    priority += FRONTIER_POSITION_WEIGHT * (1 - position / max(total, 1))
+    age_days = url_age_days(link_url, today)
+    if age_days is None:
+        priority += FRONTIER_FRESHNESS_WEIGHT * 0.5
+    else:
+        priority += FRONTIER_FRESHNESS_WEIGHT * 0.5 ** (age_days / FRONTIER_FRESHNESS_HALF_LIFE_DAYS)
+    return priority - FRONTIER_DEPTH_PENALTY * depth
+
+class Frontier:
+    """单个站点的爬取队列，保存在数据库中，进程中断后下次任务会从中继续。
+
+    起始页深度为0，从深度为d的页面发现的链接深度为d+1，超过max_depth的链接不再入队；
+    位于最大深度的链接只接受文章链接，更浅的层级也接受站内的其他页面（例如栏目页）用于继续发现文章。
+    已入库或已识别为重复的URL不会入队。
+    """
+
+    def __init__(self, site_key, site_config, known_urls=(), max_depth=CRAWL_MAX_DEPTH):
+        self.site_key = site_key
+        self.site_config = site_config
+        self.known_urls = known_urls
+        self.max_depth = max_depth
+        self.fetched = 0
+
+    def resume(self):
+        """恢复上次中断时留下的队列，返回待抓取的URL数"""
+        pending, self.fetched = database.frontier_resume(self.site_key)
+        if pending or self.fetched:
+            logging.info(f"站点{self.site_key}从上次中断处继续：已抓取{self.fetched}个页面，待抓取{pending}个。")
+        return pending
+
+    def __contains__(self, url):
+        return database.frontier_contains(self.site_key, url)
+
+    def add_seed(self, url):
+        """把起始页加入队列"""
+        database.frontier_push(self.site_key, [(url, 0, SEED_PRIORITY)])
+
+    def add_links(self, link_urls, depth):
+        """按优先级把从页面中发现的链接加入队列，返回入队的链接数"""
+        if depth > self.max_depth:
+            return 0
+        link_urls = list(dict.fromkeys(link_urls))
+        accept = is_article_link if depth == self.max_depth else is_allowed_link
+        today = date.today()
+        entries = [
+            (url, depth, score_link(url, position, len(link_urls), depth, self.site_config, today))
+            for position, url in enumerate(link_urls)
+            if url not in self.known_urls and accept(url, self.site_config)
+        ]
+        database.frontier_push(self.site_key, entries)
+        return len(entries)
+
+    def pop(self, limit):
+        """取出优先级最高的limit个URL，返回[(url, 深度), ...]"""
+        return database.frontier_pop(self.site_key, limit) if limit > 0 else []
+
+    def mark(self, url, status):
+        """记录URL的抓取结果：done或failed计入已抓取页面数，skipped不计入。
+
+        抓取失败的URL放回队列，尝试CRAWL_URL_MAX_ATTEMPTS次后才最终标记为failed。
+        """
+        if status == 'failed':
+            database.frontier_retry(self.site_key, url, CRAWL_URL_MAX_ATTEMPTS)
+        else:
+            database.frontier_mark(self.site_key, url, status)
+        if status in ('done', 'failed'):
+            self.fetched += 1
+
+    def clear(self):
+        """站点爬取完成后清空队列"""
+        database.frontier_clear(self.site_key)
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+
+from config import (
+    POST_CRAWL_SELECTORS, MAX_PAGES_PER_SITE, ADAPTIVE_SCHEDULING_ENABLED, SCHEDULER_POLL_MINUTES,
+    JOB_LEASE_SECONDS, JOB_TASK_MAX_ATTEMPTS, JOB_RETRY_DELAY_MINUTES, WORKER_MAX_SITES, WORKER_POLL_SECONDS
+)
+import database
+import site_schedule
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 爬取任务保存在SQLite中：每个任务按站点拆分为站点任务，由一个或多个worker进程领取。
+# worker领取站点任务时加上租约并在运行期间定期续期，worker异常退出后租约过期，
+# 其他worker会重新领取该任务，并从站点的持久化爬取队列中断处继续。
+
+def enqueue_crawl_job(site_keys=None, trigger='api'):
+    """为指定站点（默认全部站点）创建爬取任务，返回(任务id, 已在队列中而被跳过的站点)。
+
+    站点名无效时抛出ValueError。
+    """
+    if site_keys is None:
+        site_keys = list(POST_CRAWL_SELECTORS)
+    unknown = [site_key for site_key in site_keys if site_key not in POST_CRAWL_SELECTORS]
+    if unknown:
+        raise ValueError(f"未知的站点: {', '.join(unknown)}")
+    job_id, skipped = database.create_crawl_job(site_keys, trigger)
+    if job_id is not None:
+        logging.info(f"已创建爬取任务{job_id}（{trigger}），站点: {', '.join(s for s in site_keys if s not in skipped)}")
+    return job_id, skipped
+
+def enqueue_due_sites():
+    """把已到爬取时间的站点加入队列，返回任务id，没有到期站点时返回None"""
+    due = site_schedule.due_sites(POST_CRAWL_SELECTORS, database.get_site_schedules())
+    if not due:
+        return None
+    job_id, _ = enqueue_crawl_job(due, trigger='schedule')
+    return job_id
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class LeaseKeeper:
+    """在后台线程中定期为worker持有的站点任务续期，用作上下文管理器。
+
+    lease_lost为{站点: threading.Event}，某个站点任务的租约失效（已被其他worker接管，
+    或连续续期失败超过租约时长）时设置对应的事件，爬取该站点的协程据此中止。
+    """
+
+    def __init__(self, worker_id, tasks, lease_seconds=JOB_LEASE_SECONDS):
+        self.worker_id = worker_id
+        self.tasks = list(tasks)
+        self.lease_seconds = lease_seconds
+        self.lease_lost = {task['site_key']: threading.Event() for task in self.tasks}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _mark_lost(self, tasks):
+        for task in tasks:
+            self.lease_lost[task['site_key']].set()
+        self.tasks = [task for task in self.tasks if not self.lease_lost[task['site_key']].is_set()]
+
+    def _run(self):
+        last_renewed = time.monotonic()
+        while self.tasks and not self._stopped.wait(self.lease_seconds / 3):
+            try:
+                lost = database.renew_crawl_task_leases(self.worker_id, self.tasks, self.lease_seconds)
+                last_renewed = time.monotonic()
+                if lost:
+                    logging.warning(f"站点任务的租约已失效，可能已被其他worker接管，中止爬取: "
+                                    f"{', '.join(task['site_key'] for task in lost)}")
+                    self._mark_lost(lost)
+            except Exception as e:
+                logging.error(f"续期站点任务租约时出错: {e}")
+                if time.monotonic() - last_renewed >= self.lease_seconds:
+                    logging.warning("超过租约时长未能续期，中止所有站点的爬取。")
+                    self._mark_lost(self.tasks)
+        database.close_db_connection()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stopped.set()
+        self._thread.join()
+        return False
+
+def run_tasks(worker_id, tasks):
+    """在一次爬取中运行已领取的站点任务，记录结果并安排各站点的下次爬取时间"""
+    # 延迟导入：只提交和查询任务的进程（例如API）不需要加载爬虫
+    import scheduler
+
+    site_keys = [task['site_key'] for task in tasks]
+    logging.info(f"worker {worker_id}开始爬取: {', '.join(site_keys)}")
+    states = database.get_site_schedules()
+    with LeaseKeeper(worker_id, tasks) as lease_keeper:
+        try:
+            site_counts, site_errors = asyncio.run(scheduler.run_crawl_job_async(site_keys, lease_keeper.lease_lost))
+        except Exception as e:
+            logging.error(f"运行爬取任务时发生错误: {e}", exc_info=True)
+            site_counts, site_errors = {}, {site_key: str(e) or type(e).__name__ for site_key in site_keys}
+
+    for task in tasks:
+        site_key = task['site_key']
+        counts = site_counts.get(site_key, [0, 0, 0])
+        error = site_errors.get(site_key)
+        if error is None:
+            status = 'done'
+            new_state = (site_schedule.next_site_state(site_key, states.get(site_key), counts[1], MAX_PAGES_PER_SITE)
+                         if ADAPTIVE_SCHEDULING_ENABLED else site_schedule.fixed_site_state(site_key, states.get(site_key)))
+            logging.info(f"站点{site_key}发布速率约{new_state['rate_per_hour']:.2f}条/小时，"
+                         f"{new_state['interval_hours']:.1f}小时后再次爬取（{new_state['next_run_at']} UTC）。")
+        elif task['attempts'] < JOB_TASK_MAX_ATTEMPTS:
+            # 稍后重试，站点的爬取队列保留在数据库中，重试时从中断处继续
+            status = 'queued'
+            new_state = None
+            logging.warning(f"站点{site_key}第{task['attempts']}次爬取失败，"
+                            f"{JOB_RETRY_DELAY_MINUTES * task['attempts']}分钟后重试。")
+        else:
+            status = 'failed'
+            new_state = site_schedule.postponed_site_state(site_key, states.get(site_key))
+            logging.error(f"站点{site_key}爬取失败{task['attempts']}次，放弃本次任务。")
+
+        # 站点的下次爬取时间与任务结束状态在同一个事务中保存
+        finished = database.finish_crawl_task(
+            task, worker_id, status, counts, error,
+            retry_delay_seconds=JOB_RETRY_DELAY_MINUTES * 60 * task['attempts'] if status == 'queued' else 0,
+            schedule_state=new_state
+        )
+        if not finished:
+            logging.warning(f"任务{task['job_id']}中站点{site_key}的租约已失效，结果未记录。")
+
+def run_worker(worker_id=None, once=False):
+    """worker主循环：定期把到期站点加入队列，领取站点任务并爬取。
+
+    once为True时处理完当前可领取的任务后返回。
+    可以同时运行多个worker，每个站点同时只会被一个worker爬取。
+    """
+    worker_id = worker_id or default_worker_id()
+    logging.info(f"worker {worker_id}启动，每{SCHEDULER_POLL_MINUTES}分钟检查一次到期站点。")
+    next_schedule_check = 0.0
+    while True:
+        if time.monotonic() >= next_schedule_check:
+            try:
+                enqueue_due_sites()
+            except Exception as e:
+                logging.error(f"安排到期站点时出错: {e}")
+            next_schedule_check = time.monotonic() + SCHEDULER_POLL_MINUTES * 60
+
+        tasks = database.claim_crawl_tasks(worker_id, WORKER_MAX_SITES, JOB_LEASE_SECONDS, JOB_TASK_MAX_ATTEMPTS)
+        if tasks:
+            run_tasks(worker_id, tasks)
+            continue
+        if once:
+            logging.info(f"worker {worker_id}没有可领取的任务，退出。")
+            return
+        time.sleep(WORKER_POLL_SECONDS)
@@ -0,0 +1,163 @@
+from collections import deque
+
+from config import KEYWORD_AUTOMATON_MIN_PATTERNS
+
+class KeywordMatcher:
+    """多类别关键词匹配器。
+
+    关键词较少时逐个用str.count查找，每次查找都在C中完成，比纯Python逐字符扫描更快；
+    关键词数量达到automaton_min_patterns后，改为把所有关键词编译进一个Aho-Corasick自动机，
+    每篇文本只扫描一遍，耗时与关键词数量无关。
+    匹配不区分大小写，相互重叠的不同关键词都会被报告；同一个关键词的出现次数两种方式都与str.count一致，
+    按从左到右互不重叠计数（例如"aa"在"aaa"中出现1次）。
+    """
+
+    def __init__(self, categories, weights=None, automaton_min_patterns=KEYWORD_AUTOMATON_MIN_PATTERNS):
+        """categories为{类别: [关键词, ...]}，weights为可选的{关键词: 权重}，默认权重为1"""
+        weights = {kw.lower(): w for kw, w in (weights or {}).items()}
+        self.patterns = []
+        self.weights = []
+        self.category_patterns = {}
+        pattern_ids = {}
+        for category, keywords in categories.items():
+            ids = []
+            for keyword in keywords:
+                pattern = keyword.lower()
+                if not pattern:
+                    continue
+                if pattern not in pattern_ids:
+                    pattern_ids[pattern] = len(self.patterns)
+                    self.patterns.append(pattern)
+                    self.weights.append(weights.get(pattern, 1.0))
+                ids.append(pattern_ids[pattern])
+            self.category_patterns[category] = ids
+        self.use_automaton = len(self.patterns) >= automaton_min_patterns
+        if self.use_automaton:
+            self._build()
+
+    def _build(self):
+        """构建自动机的goto/fail/output表"""
+        self._lengths = [len(pattern) for pattern in self.patterns]
+        self._goto = [{}]
+        self._output = [[]]
+        for pattern_id, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(pattern_id)
+
+        # 按广度优先计算失败指针，并把失败状态的输出合并到当前状态
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail_state = self._fail[state]
+                while fail_state and char not in self._goto[fail_state]:
+                    fail_state = self._fail[fail_state]
+                self._fail[next_state] = self._goto[fail_state].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def count(self, text):
+        """返回{关键词编号: 出现次数}"""
+        counts = {}
+        if not text or not self.patterns:
+            return counts
+        text = text.lower()
+        if not self.use_automaton:
+            for pattern_id, pattern in enumerate(self.patterns):
+                occurrence_count = text.count(pattern)
+                if occurrence_count:
+                    counts[pattern_id] = occurrence_count
+            return counts
+
+        goto, fail, output = self._goto, self._fail, self._output
+        lengths = self._lengths
+        root = goto[0]
+        state = 0
+        # 每个关键词下一次出现最早可以开始的位置，与上一次计数的出现重叠的匹配不计数
+        next_start = {}
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0) if state else root.get(char, 0)
+            for pattern_id in output[state]:
+                if position - lengths[pattern_id] + 1 >= next_start.get(pattern_id, 0):
+                    counts[pattern_id] = counts.get(pattern_id, 0) + 1
+                    next_start[pattern_id] = position + 1
+        return counts
+
+    def score(self, text):
+        """返回每个类别的匹配结果：
+
+        hits为命中的关键词个数（与原先逐个子串查找的计分方式一致），
+        occurrences为关键词出现的总次数，weighted为按关键词权重加权的出现次数。
+        """
+        counts = self.count(text)
+        scores = {}
+        for category, pattern_ids in self.category_patterns.items():
+            hits = 0
+            occurrences = 0
+            weighted = 0.0
+            for pattern_id in pattern_ids:
+                occurrence_count = counts.get(pattern_id, 0)
+                if occurrence_count:
+                    hits += 1
+                    occurrences += occurrence_count
+                    weighted += self.weights[pattern_id] * occurrence_count
+            scores[category] = {'hits': hits, 'occurrences': occurrences, 'weighted': weighted}
+        return scores
+
+    def matched_keywords(self, text):
+        """返回文本中出现的所有关键词"""
+        return [self.patterns[pattern_id] for pattern_id in self.count(text)]
+
+def check_parity(texts=None):
+    """用子串查找和自动机两种方式为同一批文本计分，返回结果不一致的(文本名, 差异说明)列表。
+
+    texts为(文本名, 文本)的序列，默认使用fixtures/pages下各样例页面的正文，
+    另加一篇由所有领域关键词拼接成的文本，保证每个关键词以及关键词之间的重叠都被覆盖到。
+    """
+    # 延迟导入：nlp_processor依赖本模块
+    import extractors
+    import nlp_processor
+    from config import DOMAIN_KEYWORDS, POST_CRAWL_SELECTORS
+
+    if texts is None:
+        texts = []
+        for site_key, path, html_content in extractors.iter_fixture_pages():
+            parsed = extractors.parse_content(html_content, POST_CRAWL_SELECTORS[site_key]['selectors'])
+            texts.append((path, parsed.get('cleaned_content') or ""))
+        keywords = [keyword for category_keywords in DOMAIN_KEYWORDS.values() for keyword in category_keywords]
+        texts.append(('DOMAIN_KEYWORDS', " ".join(keywords) + "".join(keywords) * 2))
+
+    matchers = {
+        'substring': KeywordMatcher(DOMAIN_KEYWORDS, automaton_min_patterns=float('inf')),
+        'automaton': KeywordMatcher(DOMAIN_KEYWORDS, automaton_min_patterns=0),
+    }
+    mismatches = []
+    for name, text in texts:
+        scores = {mode: matcher.score(text) for mode, matcher in matchers.items()}
+        if scores['substring'] != scores['automaton']:
+            mismatches.append((name, f"得分不一致: {scores}"))
+            continue
+        # 得分相同时最高类别必然相同，这里仍单独比较，以便分类规则变化时也能发现差异
+        top = {mode: nlp_processor.best_category(mode_scores) for mode, mode_scores in scores.items()}
+        if top['substring'] != top['automaton']:
+            mismatches.append((name, f"最高类别不一致: {top}"))
+    return mismatches
+
+if __name__ == "__main__":
+    import sys
+    mismatches = check_parity()
+    for name, difference in mismatches:
+        print(f"{name} {difference}")
+    print(f"不一致的文本数: {len(mismatches)}")
+    sys.exit(1 if mismatches else 0)
@@ -1,9 +1,8 @@
 import logging
 import database
-import scheduler
 import api
-import time
 import os
+import subprocess
 import sys
 
 # 确保能导入同目录下的模块
@@ -28,16 +27,17 @@ if __name__ == "__main__":
         logging.critical(f"初始化数据库失败: {e}. 退出。")
         exit(1)
 
-    # 2. 在后台线程中启动调度器
-    # 调度器将立即运行第一个任务
-    scheduler.run_scheduler_in_thread()
-
-    # 给调度器线程一点时间启动
-    time.sleep(2)
+    # 2. 在单独的进程中启动爬取worker
+    # 爬取中的解析和NLP不再与API请求争用同一个进程的GIL，两者只通过数据库通信
+    worker_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker.py")
+    worker_process = subprocess.Popen([sys.executable, worker_script])
+    logging.info(f"爬取worker进程已启动（PID {worker_process.pid}）。")
 
     # 3. 启动API服务器（这将阻塞主线程）
-    # 在启动后台调度器后，在主线程中运行API
-    api.run_api(debug=False)
+    try:
+        api.run_api(debug=False)
+    finally:
+        worker_process.terminate()
+        worker_process.wait()
 
     logging.info("应用程序完成。")  # 如果API无限期运行，可能不会达到这一行
-
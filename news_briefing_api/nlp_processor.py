@@ -1,87 +1,260 @@
 import logging
-import nltk
-from sumy.parsers.plaintext import PlaintextParser
-from sumy.nlp.tokenizers import Tokenizer
-from sumy.summarizers.lsa import LsaSummarizer
-import yake
-from config import SUMMARY_SENTENCE_COUNT, KEYWORD_COUNT, DOMAIN_KEYWORDS
-
-# 下载必要的NLTK数据（只需运行一次）
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    logging.info("下载NLTK 'punkt'分词器数据...")
-    nltk.download('punkt')
-
-def process_text(text, domain=None):
-    """对输入文本进行摘要和关键词提取处理"""
-    summary = ""
-    keywords = []
-    domain_category = ""
-
-    if not text or not isinstance(text, str):
-        logging.warning("NLP处理收到空或无效文本。")
-        return {'summary': summary, 'keywords': keywords, 'category': domain_category}
-
-    # --- 使用sumy进行摘要 ---
-    try:
-        parser = PlaintextParser.from_string(text, Tokenizer("english"))  # 可根据需要调整语言
-        summarizer = LsaSummarizer()
-        summary_sentences = summarizer(parser.document, SUMMARY_SENTENCE_COUNT)
-        summary = " ".join(str(sentence) for sentence in summary_sentences)
-    except Exception as e:
-        logging.error(f"摘要过程中出错: {e}")
-        # 失败时留空摘要
-
-    # --- 使用YAKE!进行关键词提取 ---
-    try:
-        # 根据需要调整参数（语言，n-gram大小等）
-        kw_extractor = yake.KeywordExtractor(lan="en", n=3, dedupLim=0.9, top=KEYWORD_COUNT, features=None)
-        raw_keywords = kw_extractor.extract_keywords(text)
-        keywords = [kw[0] for kw in raw_keywords]  # 仅获取关键词文本
-    except Exception as e:
-        logging.error(f"关键词提取过程中出错: {e}")
-        # 失败时留空关键词列表
-
-    # --- 内容分类 ---
-    if domain is None:
-        # 自动检测领域分类
-        domain_category = categorize_content(text, keywords)
-    else:
-        domain_category = domain
-        
-    return {
-        'summary': summary,
-        'keywords': keywords,
-        'category': domain_category
-    }
+import re
+import time
+from config import (
+    SUMMARY_SENTENCE_COUNT, KEYWORD_COUNT, DOMAIN_KEYWORDS, CATEGORY_MULTI_LABEL_RATIO,
+    NLP_MAX_INPUT_CHARS, NLP_MAX_SENTENCES, NLP_MAX_SENTENCE_CHARS, NLTK_AUTO_DOWNLOAD
+)
+from keyword_matcher import KeywordMatcher
 
-def categorize_content(text, extracted_keywords=None):
-    """根据文本内容和提取的关键词自动分类内容领域"""
+# sumy、yake和nltk导入较慢，在首次构建NlpEngine时才导入，
+# 这样只做分类或只提供API的进程不必加载它们
+
+# 英文分词需要的NLTK数据：包名 -> 查找路径（新版NLTK使用punkt_tab）
+NLTK_RESOURCES = {'punkt': 'tokenizers/punkt', 'punkt_tab': 'tokenizers/punkt_tab'}
+
+_nltk_checked = False
+
+def ensure_nltk_data():
+    """检查英文分词需要的NLTK数据，缺少时按NLTK_AUTO_DOWNLOAD下载。每个进程只检查一次"""
+    global _nltk_checked
+    if _nltk_checked:
+        return
+    _nltk_checked = True
+    import nltk
+    for package, path in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            if not NLTK_AUTO_DOWNLOAD:
+                logging.warning(f"缺少NLTK '{package}'数据，英文摘要将不可用。请预先运行 python -m nltk.downloader {package}")
+                continue
+            logging.info(f"下载NLTK '{package}'分词器数据...")
+            nltk.download(package, quiet=True)
+
+# YAKE!使用的语言代码
+YAKE_LANGUAGES = {"english": "en", "chinese": "zh"}
+
+_CJK_CHAR = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+_LATIN_CHAR = re.compile(r'[A-Za-z]')
+_CJK_SENTENCE_SPLIT = re.compile(r'(?<=[。！？!?；;…])|\n+')
+_CJK_PUNCTUATION = {'，': ', ', '。': '. ', '！': '! ', '？': '? ', '；': '; ', '：': ': ', '、': ', '}
+_CJK_PUNCTUATION_PATTERN = re.compile('[' + ''.join(_CJK_PUNCTUATION) + ']')
+_CJK_WORD = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[A-Za-z0-9]+')
+
+def detect_language(text, sample_chars=2000):
+    """根据开头部分汉字与拉丁字母的比例判断文本语言，返回'chinese'或'english'"""
+    sample = (text or "")[:sample_chars]
+    cjk_count = len(_CJK_CHAR.findall(sample))
+    latin_count = len(_LATIN_CHAR.findall(sample))
+    if cjk_count and cjk_count >= 0.2 * (cjk_count + latin_count):
+        return "chinese"
+    return "english"
+
+class CjkTokenizer:
+    """实现sumy分词器接口的中文分词器。
+
+    按中文句末标点和换行切分句子，超过max_sentence_chars的句子按长度再切分；
+    词语使用汉字二元组（英文和数字按整词），无需额外的分词词典。
+    """
+
+    language = "chinese"
+
+    def __init__(self, max_sentence_chars=NLP_MAX_SENTENCE_CHARS):
+        self.max_sentence_chars = max_sentence_chars
+
+    def to_sentences(self, paragraph):
+        sentences = []
+        for sentence in _CJK_SENTENCE_SPLIT.split(paragraph):
+            sentence = sentence.strip()
+            while len(sentence) > self.max_sentence_chars:
+                sentences.append(sentence[:self.max_sentence_chars])
+                sentence = sentence[self.max_sentence_chars:].strip()
+            if sentence:
+                sentences.append(sentence)
+        return sentences
+
+    def to_words(self, sentence):
+        words = []
+        for token in _CJK_WORD.findall(sentence):
+            if len(token) > 1 and _CJK_CHAR.match(token):
+                words.extend(token[i:i + 2] for i in range(len(token) - 1))
+            else:
+                words.append(token)
+        return words
+
+class NlpEngine:
+    """NLP处理引擎：分词器、摘要器和关键词提取器只构建一次，供多篇文本重复使用。
+
+    通过get_engine()获取，每个进程按语言和参数缓存一个实例。
+    送入摘要和关键词提取的文本不超过NLP_MAX_INPUT_CHARS个字符，
+    送入LSA的句子不超过NLP_MAX_SENTENCES句，因此每篇文本的最坏处理开销是有界的。
+    """
+
+    def __init__(self, language="english",
+                 sentence_count=SUMMARY_SENTENCE_COUNT, keyword_count=KEYWORD_COUNT):
+        self.language = language
+        self.sentence_count = sentence_count
+        self.keyword_count = keyword_count
+        # 中文句子之间不加空格
+        self.sentence_separator = "" if language == "chinese" else " "
+
+        self.tokenizer = None
+        self.summarizer = None
+        try:
+            from sumy.nlp.tokenizers import Tokenizer
+            from sumy.summarizers.lsa import LsaSummarizer
+            if language != "chinese":
+                ensure_nltk_data()
+            self.tokenizer = CjkTokenizer() if language == "chinese" else Tokenizer(language)
+            self.summarizer = LsaSummarizer()
+        except Exception as e:
+            logging.error(f"初始化摘要器时出错（语言: {language}）: {e}")
+
+        yake_language = YAKE_LANGUAGES.get(language, "en")
+        self.keyword_extractor = None
+        try:
+            import yake
+            # 根据需要调整参数（语言，n-gram大小等）
+            self.keyword_extractor = yake.KeywordExtractor(
+                lan=yake_language, n=3, dedupLim=0.9, top=keyword_count, features=None
+            )
+        except Exception as e:
+            logging.error(f"初始化关键词提取器时出错（语言: {yake_language}）: {e}")
+
+    def summarize(self, text):
+        """使用sumy的LSA算法生成摘要，失败时返回空字符串"""
+        if self.summarizer is None:
+            return ""
+        from sumy.models.dom import ObjectDocumentModel, Paragraph
+        from sumy.parsers.plaintext import PlaintextParser
+        try:
+            parser = PlaintextParser.from_string(text[:NLP_MAX_INPUT_CHARS], self.tokenizer)
+            document = parser.document
+            if len(document.sentences) > NLP_MAX_SENTENCES:
+                # 只保留前NLP_MAX_SENTENCES句，限制LSA的矩阵规模
+                document = ObjectDocumentModel([Paragraph(list(document.sentences[:NLP_MAX_SENTENCES]))])
+            summary_sentences = self.summarizer(document, self.sentence_count)
+            return self.sentence_separator.join(str(sentence) for sentence in summary_sentences)
+        except Exception as e:
+            logging.error(f"摘要过程中出错: {e}")
+            return ""
+
+    def extract_keywords(self, text):
+        """使用YAKE!提取关键词，失败时返回空列表"""
+        if self.keyword_extractor is None:
+            return []
+        text = text[:NLP_MAX_INPUT_CHARS]
+        if self.language == "chinese":
+            # YAKE!不识别中文标点，换成英文标点后才能按分句切出候选关键词
+            text = _CJK_PUNCTUATION_PATTERN.sub(lambda m: _CJK_PUNCTUATION[m.group()], text)
+        try:
+            raw_keywords = self.keyword_extractor.extract_keywords(text)
+            return [kw[0] for kw in raw_keywords]  # 仅获取关键词文本
+        except Exception as e:
+            logging.error(f"关键词提取过程中出错: {e}")
+            return []
+
+    def process(self, text, domain=None):
+        """对单篇文本进行摘要、关键词提取和领域分类。
+
+        结果中的timings为各步骤的耗时（秒），NLP在子进程中运行时由调用方汇总到指标中。
+        """
+        if not text or not isinstance(text, str):
+            logging.warning("NLP处理收到空或无效文本。")
+            return {'summary': "", 'keywords': [], 'category': "", 'timings': {}}
+
+        start = time.perf_counter()
+        summary = self.summarize(text)
+        summarized = time.perf_counter()
+        keywords = self.extract_keywords(text)
+        extracted = time.perf_counter()
+
+        # --- 内容分类 ---
+        if domain is None:
+            # 自动检测领域分类
+            domain_category = categorize_content(text, keywords)
+        else:
+            domain_category = domain
+        categorized = time.perf_counter()
+
+        return {
+            'summary': summary,
+            'keywords': keywords,
+            'category': domain_category,
+            'timings': {
+                'summarize': summarized - start,
+                'keywords': extracted - summarized,
+                'categorize': categorized - extracted
+            }
+        }
+
+    def process_many(self, texts, domain=None):
+        """批量处理多篇文本，结果顺序与输入顺序一致"""
+        return [self.process(text, domain) for text in texts]
+
+_engines = {}
+
+def get_engine(language="english", sentence_count=SUMMARY_SENTENCE_COUNT, keyword_count=KEYWORD_COUNT):
+    """返回当前进程中按语言和参数缓存的NlpEngine实例"""
+    key = (language, sentence_count, keyword_count)
+    engine = _engines.get(key)
+    if engine is None:
+        engine = NlpEngine(language, sentence_count, keyword_count)
+        _engines[key] = engine
+    return engine
+
+def process_text(text, domain=None, language=None):
+    """对输入文本进行摘要和关键词提取处理，未指定语言时自动检测"""
+    return get_engine(language or detect_language(text)).process(text, domain)
+
+def process_many(texts, domain=None, language=None):
+    """批量处理多篇文本，结果顺序与输入顺序一致"""
+    return [process_text(text, domain, language) for text in texts]
+
+_domain_matcher = None
+
+def get_domain_matcher():
+    """返回由DOMAIN_KEYWORDS编译的关键词匹配器，每个进程只编译一次"""
+    global _domain_matcher
+    if _domain_matcher is None:
+        _domain_matcher = KeywordMatcher(DOMAIN_KEYWORDS)
+    return _domain_matcher
+
+def score_categories(text, extracted_keywords=None):
+    """计算文本在每个领域的得分：命中关键词数hits、出现次数occurrences和加权得分weighted"""
     # 如果没有提供提取的关键词，使用空列表
     if extracted_keywords is None:
         extracted_keywords = []
-    
-    # 将文本和提取的关键词合并为一个字符串进行分析
-    combined_text = text.lower() + " " + " ".join(extracted_keywords).lower()
-    
-    # 计算每个领域关键词的匹配数量
-    domain_scores = {}
-    for domain, keywords in DOMAIN_KEYWORDS.items():
-        score = 0
-        for keyword in keywords:
-            if keyword.lower() in combined_text:
-                score += 1
-        domain_scores[domain] = score
-    
-    # 选择得分最高的领域（如果有多个得分相同的最高领域，选择第一个）
-    if domain_scores:
-        max_score = max(domain_scores.values())
-        if max_score > 0:  # 至少要有一个关键词匹配
-            for domain, score in domain_scores.items():
-                if score == max_score:
-                    return domain
-    
+
+    # 将文本和提取的关键词合并为一个字符串，只扫描一遍
+    combined_text = (text or "") + " " + " ".join(extracted_keywords)
+    return get_domain_matcher().score(combined_text)
+
+def categorize_content(text, extracted_keywords=None):
+    """根据文本内容和提取的关键词自动分类内容领域"""
+    return best_category(score_categories(text, extracted_keywords))
+
+def best_category(domain_scores):
+    """从score_categories的结果中选出命中关键词最多的领域，没有任何命中时返回空字符串"""
+    # 选择命中关键词最多的领域（如果有多个得分相同的最高领域，选择第一个）
+    best_domain = ""
+    best_hits = 0  # 至少要有一个关键词匹配
+    for domain, scores in domain_scores.items():
+        if scores['hits'] > best_hits:
+            best_domain = domain
+            best_hits = scores['hits']
+
     # 如果没有明确匹配，返回空字符串
-    return ""
+    return best_domain
+
+def categorize_content_multi(text, extracted_keywords=None, min_ratio=CATEGORY_MULTI_LABEL_RATIO):
+    """多标签分类：返回命中数不低于最高命中数min_ratio倍的所有领域，按得分从高到低排列"""
+    domain_scores = score_categories(text, extracted_keywords)
+    max_hits = max((scores['hits'] for scores in domain_scores.values()), default=0)
+    if max_hits == 0:
+        return []
 
+    threshold = max_hits * min_ratio
+    labels = [domain for domain, scores in domain_scores.items() if scores['hits'] >= threshold]
+    return sorted(labels, key=lambda domain: (domain_scores[domain]['hits'], domain_scores[domain]['weighted']), reverse=True)
@@ -0,0 +1,312 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from config import (
+    PIPELINE_QUEUE_SIZE, PIPELINE_PARSE_WORKERS, NLP_PROCESS_WORKERS, PIPELINE_STATS_INTERVAL_SECONDS,
+    DB_BATCH_SIZE, DB_FLUSH_INTERVAL_SECONDS, DEDUP_MIN_CHARS
+)
+import database
+import nlp_processor
+from metrics import DB_WRITE_SECONDS, PAGES, JobTimings, observe_stage
+from simhash import simhash
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+STAGES = ('parse', 'nlp', 'store')
+
+class StageStats:
+    """单个流水线阶段的计数器：入队数、完成数以及队列深度"""
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.enqueued = 0
+        self.completed = 0
+        self.max_depth = 0
+
+    def record_put(self):
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def record_done(self):
+        self.completed += 1
+
+    def snapshot(self):
+        return {
+            'depth': self.queue.qsize(),
+            'max_depth': self.max_depth,
+            'enqueued': self.enqueued,
+            'completed': self.completed
+        }
+
+class CrawlPipeline:
+    """爬取处理流水线：抓取 → 解析 → NLP → 入库。
+
+    各阶段之间通过有界asyncio队列连接，队列满时上游等待，形成背压；
+    NLP阶段在进程池中运行，不会阻塞事件循环中的页面抓取；
+    入库阶段缓存结果，每DB_BATCH_SIZE条或每DB_FLUSH_INTERVAL_SECONDS秒在一个事务中批量写入。
+    传入dedup_index时，解析阶段按正文SimHash指纹查找近似重复的文章，
+    重复的文章只记录到其首次出现的简报下，不再做NLP处理和入库。
+    用法：
+        async with CrawlPipeline(known_urls, parse_content) as pipeline:
+            await pipeline.submit(site_key, site_config, url, result)
+    退出上下文时会等待所有已提交的页面处理完毕。
+    """
+
+    def __init__(self, known_urls, parse_page, dedup_index=None,
+                 queue_size=PIPELINE_QUEUE_SIZE,
+                 parse_workers=PIPELINE_PARSE_WORKERS,
+                 nlp_workers=NLP_PROCESS_WORKERS):
+        self.known_urls = known_urls
+        self.parse_page = parse_page
+        self.dedup_index = dedup_index
+        self.parse_workers = parse_workers
+        self.nlp_workers = nlp_workers or os.cpu_count() or 1
+        self.queues = {stage: asyncio.Queue(maxsize=queue_size) for stage in STAGES}
+        self.stats = {stage: StageStats(self.queues[stage]) for stage in STAGES}
+        self.site_counts = {}
+        self.timings = JobTimings()
+        self._executor = None
+        self._writer = None
+        self._tasks = []
+        self._store_buffer = []
+        self._duplicate_buffer = []
+        # 已登记到去重索引、但还没有入库的文章指纹：{URL: 指纹}；以及处理失败、已从索引中删除的文章
+        self._pending_fingerprints = {}
+        self._failed_canonicals = set()
+        self._last_flush = time.monotonic()
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                await self.join()
+        finally:
+            await self.close()
+
+    def start(self):
+        """启动进程池和各阶段的工作协程"""
+        # 使用spawn启动子进程，避免在多线程进程（API线程、调度器线程）中fork
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.nlp_workers,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+        # 压缩和写入事务（可能等待SQLite写锁）放在单独的写入线程中执行，不阻塞事件循环中的抓取；
+        # 只用一个线程，各批依次写入，并复用该线程的数据库连接
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pipeline-writer')
+        workers = [('parse', self._parse)] * self.parse_workers
+        workers += [('nlp', self._nlp)] * self.nlp_workers
+        workers += [('store', self._store)]
+        self._tasks = [asyncio.create_task(self._run_stage(stage, handler)) for stage, handler in workers]
+        if PIPELINE_STATS_INTERVAL_SECONDS:
+            self._tasks.append(asyncio.create_task(self._report_periodically()))
+        logging.info(f"处理流水线启动：解析协程{self.parse_workers}个，NLP进程{self.nlp_workers}个。")
+
+    async def join(self):
+        """等待所有已提交的页面依次通过各阶段"""
+        for stage in STAGES:
+            await self.queues[stage].join()
+        await self.flush()
+
+    async def close(self):
+        """停止工作协程，写入剩余结果，关闭写入线程和进程池"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        try:
+            await self.flush()
+            if self._duplicate_buffer:
+                logging.warning(f"{len(self._duplicate_buffer)}篇近似重复文章的首篇文章未处理完，不记录归并关系。")
+                self._duplicate_buffer = []
+        finally:
+            if self._writer is not None:
+                await asyncio.get_running_loop().run_in_executor(self._writer, database.close_db_connection)
+                self._writer.shutdown(wait=True)
+                self._writer = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        logging.info(f"处理流水线结束，各阶段统计: {self.snapshot()}")
+
+    def snapshot(self):
+        """返回各阶段的队列深度和计数"""
+        return {stage: self.stats[stage].snapshot() for stage in STAGES}
+
+    def count(self, site_key, processed=0, added=0, skipped=0):
+        """累计站点的处理、添加和跳过数"""
+        counts = self.site_counts.setdefault(site_key, [0, 0, 0])
+        counts[0] += processed
+        counts[1] += added
+        counts[2] += skipped
+        for result, amount in (('processed', processed), ('added', added), ('skipped', skipped)):
+            if amount:
+                PAGES.inc(amount, site=site_key, result=result)
+
+    async def submit(self, site_key, site_config, url, result):
+        """抓取阶段的出口：把抓取结果送入解析队列，队列满时等待"""
+        if result is None or not getattr(result, 'success', True):
+            error = getattr(result, 'error_message', '') if result is not None else ''
+            logging.warning(f"爬取{url}失败: {error}。跳过。")
+            self.count(site_key, skipped=1)
+            return
+
+        if url in self.known_urls:
+            self.count(site_key, skipped=1)
+            return
+
+        await self._put('parse', (site_key, site_config, url, result))
+
+    async def _put(self, stage, item):
+        await self.queues[stage].put(item)
+        self.stats[stage].record_put()
+
+    async def _run_stage(self, stage, handler):
+        queue = self.queues[stage]
+        while True:
+            item = await queue.get()
+            try:
+                await handler(*item)
+            except Exception as e:
+                logging.error(f"流水线{stage}阶段处理出错: {e}", exc_info=True)
+                self.count(item[0], processed=1, skipped=1)
+                if stage != 'parse':
+                    self._release_fingerprint(item[1]['source_url'], stored=False)
+            finally:
+                self.stats[stage].record_done()
+                queue.task_done()
+
+    async def _parse(self, site_key, site_config, url, result):
+        # 从HTML中提取所需信息（在线程中执行，避免长时间占用事件循环）
+        html_content = result.html
+        start = time.perf_counter()
+        parsed_data = await asyncio.to_thread(self.parse_page, html_content, site_config['selectors'])
+        observe_stage('parse', site_key, time.perf_counter() - start, self.timings)
+
+        if not parsed_data.get('title'):
+            logging.warning(f"无法为{url}提取标题。跳过。")
+            self.count(site_key, processed=1, skipped=1)
+            return
+
+        # 使用crawl4ai提取的markdown内容进行NLP处理
+        text_for_nlp = result.markdown.raw_markdown or parsed_data.get('cleaned_content', html_content)
+        record = {
+            'title': parsed_data['title'],
+            'source_url': url,
+            'publication_date': parsed_data.get('publication_date', 'N/A'),
+            'raw_content': html_content,
+            'source_site': site_key
+        }
+
+        # 指纹只基于提取出的正文段落计算，不受各站点导航栏、页脚等markdown内容的影响；
+        # 没有提取到正文的页面不参与去重
+        fingerprint_text = parsed_data.get('cleaned_content') or ''
+        if self.dedup_index is not None and len(fingerprint_text) >= DEDUP_MIN_CHARS:
+            # SimHash是纯Python计算，放到NLP进程池中执行，避免在爬取进程中占用GIL
+            loop = asyncio.get_running_loop()
+            fingerprint = await loop.run_in_executor(self._executor, simhash, fingerprint_text)
+            match = self.dedup_index.find(fingerprint)
+            if match is not None:
+                canonical_url, distance = match
+                logging.info(f"{url}与{canonical_url}近似重复（距离{distance}），归并后跳过。")
+                self._duplicate_buffer.append({
+                    'source_url': url,
+                    'canonical_url': canonical_url,
+                    'title': record['title'],
+                    'source_site': site_key,
+                    'distance': distance
+                })
+                self.known_urls.add(url)
+                self.count(site_key, processed=1, skipped=1)
+                return
+            # 查找和登记之间没有await，同时解析的两篇重复文章不会都被当作首次出现；
+            # 指纹在文章入库前就登记，入库失败时再删除（见_release_fingerprint）
+            self.dedup_index.add(url, fingerprint)
+            self._pending_fingerprints[url] = fingerprint
+            record['simhash'] = fingerprint
+
+        await self._put('nlp', (site_key, record, text_for_nlp))
+
+    async def _nlp(self, site_key, record, text_for_nlp):
+        loop = asyncio.get_running_loop()
+        nlp_results = await loop.run_in_executor(self._executor, nlp_processor.process_text, text_for_nlp)
+        # 各NLP步骤在子进程中计时，这里汇总到当前进程的指标中
+        for stage, seconds in nlp_results.get('timings', {}).items():
+            observe_stage(stage, site_key, seconds, self.timings)
+        record['summary'] = nlp_results['summary']
+        record['keywords'] = nlp_results['keywords']
+        record['category'] = nlp_results['category']
+        await self._put('store', (site_key, record))
+
+    async def _store(self, site_key, record):
+        self._store_buffer.append(record)
+        if (len(self._store_buffer) >= DB_BATCH_SIZE
+                or time.monotonic() - self._last_flush >= DB_FLUSH_INTERVAL_SECONDS):
+            await self.flush()
+
+    async def flush(self):
+        """在写入线程中把缓存的结果在一个事务中批量写入数据库，然后记录首篇文章已入库的近似重复文章"""
+        rows, self._store_buffer = self._store_buffer, []
+        duplicates, self._duplicate_buffer = self._duplicate_buffer, []
+        self._last_flush = time.monotonic()
+        loop = asyncio.get_running_loop()
+        if rows:
+            await self._write_rows(loop, rows)
+
+        ready = []
+        orphaned = 0
+        for duplicate in duplicates:
+            canonical_url = duplicate['canonical_url']
+            if canonical_url in self._pending_fingerprints:
+                self._duplicate_buffer.append(duplicate)  # 首篇文章还在处理中，入库后再记录
+            elif canonical_url in self._failed_canonicals:
+                orphaned += 1
+            else:
+                ready.append(duplicate)
+        if orphaned:
+            # 不记录归并关系，这些页面不会出现在已入库的URL中，下次爬取时重新处理
+            logging.warning(f"{orphaned}篇近似重复文章对应的首篇文章未能入库，不记录归并关系。")
+        if ready:
+            await loop.run_in_executor(self._writer, database.add_duplicates, ready)
+
+    async def _write_rows(self, loop, rows):
+        start = time.perf_counter()
+        inserted, existing = await loop.run_in_executor(self._writer, database.add_briefings, rows)
+        elapsed = time.perf_counter() - start
+        DB_WRITE_SECONDS.observe(elapsed)
+        # 一批中可能包含多个站点的简报，按各站点的行数分摊这批的写入耗时
+        site_rows = Counter(record['source_site'] for record in rows)
+        for site_key, row_count in site_rows.items():
+            observe_stage('db_write', site_key, elapsed * row_count / len(rows), self.timings)
+        inserted_ids = {id(record) for record in inserted}
+        # URL已在数据库中的行同样可以作为近似重复文章的首篇文章
+        stored_ids = inserted_ids | {id(record) for record in existing}
+        for record in inserted:
+            self.known_urls.add(record['source_url'])
+        for record in rows:
+            self._release_fingerprint(record['source_url'], stored=id(record) in stored_ids)
+            if id(record) in inserted_ids:
+                self.count(record['source_site'], processed=1, added=1)
+            else:
+                self.count(record['source_site'], processed=1, skipped=1)
+
+    def _release_fingerprint(self, url, stored):
+        """文章入库或处理失败后结束其指纹的待定状态；未能入库时从去重索引中删除，
+        避免之后的近似重复文章被归并到不存在的简报下"""
+        fingerprint = self._pending_fingerprints.pop(url, None)
+        if fingerprint is None or stored:
+            return
+        self.dedup_index.remove(url, fingerprint)
+        self._failed_canonicals.add(url)
+
+    async def _report_periodically(self):
+        while True:
+            await asyncio.sleep(PIPELINE_STATS_INTERVAL_SECONDS)
+            logging.info(f"处理流水线队列状态: {self.snapshot()}")
@@ -0,0 +1,43 @@
+import threading
+import time
+from collections import OrderedDict
+
+class ResponseCache:
+    """进程内的LRU+TTL响应缓存。
+
+    每个缓存项记录生成时的数据版本号，版本号变化（有新数据入库）后旧缓存项即失效；
+    此外缓存项最多保留ttl_seconds秒，条目数超过max_entries时淘汰最久未使用的项。
+    """
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, generation):
+        """返回与当前数据版本匹配且未过期的缓存值，否则返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_generation, expires_at, value = entry
+                if entry_generation == generation and expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, generation, value):
+        with self._lock:
+            self._entries[key] = (generation, time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
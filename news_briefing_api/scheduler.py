@@ -1,240 +1,356 @@
-import schedule
 import time
 import logging
-import threading
 import asyncio
-from bs4 import BeautifulSoup
+import hashlib
+import re
+from datetime import datetime, timezone
+import requests
 import json
-
-# 导入crawl4ai组件
-from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode
-from crawl4ai.content_filter_strategy import PruningContentFilter
-from crawl4ai.markdown_generation_strategy import DefaultMarkdownGenerator
+from urllib.parse import urljoin, urlparse
 
 # 导入项目组件
-from config import SCRAPE_INTERVAL_HOURS, POST_CRAWL_SELECTORS
+from config import (
+    POST_CRAWL_SELECTORS, MAX_PAGES_PER_SITE, CRAWL_CONCURRENCY_PER_SITE,
+    CRAWL_MAX_CONCURRENT_PAGES, CRAWL_CONCURRENCY_PER_DOMAIN, CRAWL_HOST_DELAY_SECONDS,
+    CONDITIONAL_FETCH_ENABLED, CONDITIONAL_FETCH_TIMEOUT_SECONDS, CRAWL_STATE_MAX_AGE_HOURS, DEDUP_ENABLED
+)
 import database
-import nlp_processor
+from extractors import BeautifulSoupExtractor, parse_content
+from frontier import Frontier, is_article_link
+from metrics import observe_stage
+from pipeline import CrawlPipeline
+from simhash import SimHashIndex
+import site_schedule
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 def parse_content_with_bs(html_content, selectors):
-    """使用BeautifulSoup从HTML内容中提取特定字段"""
-    soup = BeautifulSoup(html_content, 'html.parser')
-    data = {}
-    try:
-        title_element = soup.select_one(selectors['title'])
-        data['title'] = title_element.get_text(strip=True) if title_element else None
-    except Exception as e:
-        logging.warning(f"无法使用选择器'{selectors['title']}'提取标题: {e}")
-        data['title'] = None
+    """使用BeautifulSoup从HTML内容中提取特定字段（爬取流程使用extractors.parse_content，按配置选择解析后端）"""
+    return BeautifulSoupExtractor(selectors).extract(html_content)
 
-    try:
-        date_element = soup.select_one(selectors['date'])
-        # 尝试获取文本或特定属性，比如'datetime'（如果可用）
-        if date_element:
-             data['publication_date'] = date_element.get('datetime') or date_element.get_text(strip=True)
-        else:
-             data['publication_date'] = None
-    except Exception as e:
-        logging.warning(f"无法使用选择器'{selectors['date']}'提取日期: {e}")
-        data['publication_date'] = None
+def _iter_link_urls(result):
+    """按页面中的出现顺序返回爬取结果中的链接URL（兼容列表和internal/external字典两种格式）"""
+    links = getattr(result, 'links', None) or []
+    if isinstance(links, dict):
+        links = list(links.get('internal', [])) + list(links.get('external', []))
+    for link in links:
+        link_url = link.get('href') if isinstance(link, dict) else link
+        if link_url:
+            yield link_url
+
+_HREF_PATTERN = re.compile(r'''href\s*=\s*["']([^"'#]+)''', re.IGNORECASE)
 
-    # 如果需要净化内容，可以使用以下代码提取正文段落
+def probe_start_page(url, state=None):
+    """不经过浏览器，用条件HTTP请求获取起始页。
+
+    带上上次记录的ETag和Last-Modified；返回状态码、新的校验头、响应体哈希和其中的链接，
+    请求失败时返回None。
+    """
+    headers = {}
+    if state:
+        if state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
     try:
-        content_area = soup.select_one(selectors.get('content_placeholder', 'body'))
-        if content_area:
-             # 提取段落或相关文本
-             paragraphs = content_area.find_all('p')
-             data['cleaned_content'] = "\n".join(p.get_text(strip=True) for p in paragraphs if p.get_text(strip=True))
-        else:
-             data['cleaned_content'] = None
-    except Exception as e:
-         logging.warning(f"无法使用选择器'{selectors.get('content_placeholder')}'净化内容: {e}")
-         data['cleaned_content'] = None
+        response = requests.get(url, headers=headers, timeout=CONDITIONAL_FETCH_TIMEOUT_SECONDS)
+    except requests.RequestException as e:
+        logging.warning(f"条件请求{url}失败: {e}")
+        return None
 
-    return data
+    probe = {
+        'status': response.status_code,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'content_hash': None,
+        'links': set()
+    }
+    if response.status_code == 200:
+        probe['content_hash'] = hashlib.sha256(response.content).hexdigest()
+        probe['links'] = {urljoin(url, href.strip()) for href in _HREF_PATTERN.findall(response.text)}
+    return probe
 
-async def crawl_site(site_key, site_config):
-    """为单个站点执行爬取操作"""
-    logging.info(f"开始爬取站点: {site_key}")
-    items_processed = 0
-    items_added = 0
-    items_skipped = 0
-    
-    browser_config = BrowserConfig(
+def _state_age_hours(state):
+    """返回距上次完整渲染的小时数"""
+    rendered_at = datetime.strptime(state['rendered_at'], '%Y-%m-%d %H:%M:%S')
+    now = datetime.now(timezone.utc).replace(tzinfo=None)  # SQLite的CURRENT_TIMESTAMP是UTC时间
+    return (now - rendered_at).total_seconds() / 3600
+
+def start_page_unchanged(state, probe, site_config):
+    """根据上次的抓取状态和本次的条件请求结果判断起始页是否未变化。
+
+    服务器返回304、响应体哈希相同，或者页面中的文章链接都已在上次记录的链接集合中，均视为未变化；
+    超过CRAWL_STATE_MAX_AGE_HOURS未完整渲染的页面总是视为已变化。
+    上次记录的链接集合只包含已入库或已抓取过的链接，上次因页面预算未抓取的链接不在其中。
+    """
+    if state is None or probe is None:
+        return False
+    if _state_age_hours(state) >= CRAWL_STATE_MAX_AGE_HOURS:
+        return False
+    if probe['status'] == 304:
+        return True
+    if probe['status'] != 200:
+        return False
+    if probe['content_hash'] == state['content_hash']:
+        return True
+    # 页面中常有时间、令牌等每次都不同的内容，所以再比较文章链接集合；
+    # 原始HTML中没有文章链接时（例如由脚本渲染的列表）无法判断，按已变化处理
+    article_links = {link for link in probe['links'] if is_article_link(link, site_config)}
+    return bool(article_links) and article_links <= set(state['links'])
+
+def save_start_page_state(url, result, site_config, state, probe, is_covered):
+    """站点爬取结束后记录起始页的抓取状态，供下次条件请求和比较使用。
+
+    is_covered(link)判断文章链接是否已入库或本次已成功抓取。只记录这些链接；
+    还有链接因页面预算或抓取失败而未处理时不记录校验头和哈希，
+    下次即使页面未变化也会重新渲染，把积压的文章抓完。
+    """
+    article_links = [link for link in _iter_link_urls(result) if is_article_link(link, site_config)]
+    links = [link for link in article_links if is_covered(link)]
+    if len(links) < len(article_links):
+        logging.info(f"起始页{url}上还有{len(article_links) - len(links)}个文章链接未抓取，下次爬取时重新渲染。")
+        database.save_crawl_state(url, None, None, None, links)
+        return
+
+    etag = last_modified = content_hash = None
+    if probe is not None:
+        etag = probe['etag']
+        last_modified = probe['last_modified']
+        content_hash = probe['content_hash']
+        if probe['status'] == 304 and state:
+            # 304响应不带响应体，沿用上次的校验头和哈希
+            etag = etag or state['etag']
+            last_modified = last_modified or state['last_modified']
+            content_hash = state['content_hash']
+    database.save_crawl_state(url, etag, last_modified, content_hash, links)
+
+class CrawlSession:
+    """一次爬取任务内所有站点共享的浏览器实例，以及全局和按域名的并发限制和请求间隔"""
+
+    def __init__(self, crawler, run_config,
+                 max_pages=CRAWL_MAX_CONCURRENT_PAGES,
+                 per_domain=CRAWL_CONCURRENCY_PER_DOMAIN,
+                 host_delay=CRAWL_HOST_DELAY_SECONDS,
+                 timings=None):
+        self.crawler = crawler
+        self.timings = timings
+        self.run_config = run_config
+        self.per_domain = per_domain
+        self.host_delay = host_delay
+        self._page_semaphore = asyncio.Semaphore(max_pages)
+        self._domain_semaphores = {}
+        self._host_locks = {}
+        self._host_next_request = {}
+
+    @staticmethod
+    def _domain(url):
+        domain = (urlparse(url).hostname or '').lower()
+        if domain.startswith('www.'):
+            domain = domain[4:]
+        return domain
+
+    def _domain_semaphore(self, domain):
+        if domain not in self._domain_semaphores:
+            self._domain_semaphores[domain] = asyncio.Semaphore(self.per_domain)
+        return self._domain_semaphores[domain]
+
+    async def _wait_for_host(self, domain):
+        """保证同一主机相邻两次请求的开始时间至少相隔host_delay秒"""
+        if not self.host_delay:
+            return
+        lock = self._host_locks.setdefault(domain, asyncio.Lock())
+        async with lock:
+            loop = asyncio.get_running_loop()
+            delay = self._host_next_request.get(domain, 0) - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._host_next_request[domain] = loop.time() + self.host_delay
+
+    async def fetch(self, url, site_key=''):
+        """在全局和域名并发限制以及主机请求间隔下抓取单个页面，只统计实际抓取的耗时"""
+        domain = self._domain(url)
+        async with self._domain_semaphore(domain):
+            await self._wait_for_host(domain)
+            async with self._page_semaphore:
+                start = time.perf_counter()
+                try:
+                    return await self.crawler.arun(url=url, config=self.run_config)
+                finally:
+                    observe_stage('fetch', site_key, time.perf_counter() - start, self.timings)
+
+    async def fetch_many(self, urls, concurrency=CRAWL_CONCURRENCY_PER_SITE, site_key=''):
+        """并发抓取多个页面，结果按urls的顺序返回，抓取异常的页面对应None"""
+        site_semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch_one(url):
+            async with site_semaphore:
+                try:
+                    return await self.fetch(url, site_key)
+                except Exception as e:
+                    logging.warning(f"抓取{url}时出错: {e}")
+                    return None
+
+        return await asyncio.gather(*(fetch_one(url) for url in urls))
+
+# crawl4ai导入需要一秒以上，在首次爬取时才导入；测试时可替换为模拟的爬虫类
+AsyncWebCrawler = None
+
+def get_crawler_class():
+    """返回爬虫类，首次调用时导入crawl4ai"""
+    global AsyncWebCrawler
+    if AsyncWebCrawler is None:
+        from crawl4ai import AsyncWebCrawler as crawler_class
+        AsyncWebCrawler = crawler_class
+    return AsyncWebCrawler
+
+def build_browser_config():
+    """爬取任务使用的无头浏览器配置"""
+    from crawl4ai import BrowserConfig
+    return BrowserConfig(
         headless=True,
         verbose=False
     )
-    
-    run_config = CrawlerRunConfig(
+
+def build_run_config():
+    """单个页面的爬取配置"""
+    from crawl4ai import CrawlerRunConfig, CacheMode
+    from crawl4ai.content_filter_strategy import PruningContentFilter
+    from crawl4ai.markdown_generation_strategy import DefaultMarkdownGenerator
+    return CrawlerRunConfig(
         cache_mode=CacheMode.ENABLED,
         markdown_generator=DefaultMarkdownGenerator(
             content_filter=PruningContentFilter(threshold=0.45)
         ),
     )
-    
+
+def _abort_lost_lease(site_key):
+    """站点任务的租约已失效：爬取队列交给接管的worker，返回错误信息"""
+    logging.warning(f"站点{site_key}的任务租约已失效，中止爬取，爬取队列留给接管的worker。")
+    return "站点任务的租约已失效，爬取已中止"
+
+async def crawl_site(site_key, site_config, session, pipeline, max_pages=MAX_PAGES_PER_SITE, lease_lost=None):
+    """使用共享的爬取会话抓取单个站点，抓到的页面送入处理流水线。
+
+    待抓取的页面保存在持久化的爬取队列中，按优先级每次取出一批并发抓取，
+    抓取到的页面中的链接按深度限制和优先级加入队列，直到队列为空或达到max_pages；
+    站点爬取中途中断时队列保留在数据库中，下次任务从中断处继续。
+    lease_lost为threading.Event，站点任务的租约失效（已由其他worker接管）时被设置，
+    此时在下一批抓取前中止，不再修改爬取队列和起始页状态。
+    成功时返回None，出错时返回错误信息。
+    """
+    logging.info(f"开始爬取站点: {site_key}")
+    frontier = Frontier(site_key, site_config, pipeline.known_urls)
+
     try:
-        # 使用AsyncWebCrawler
-        async with AsyncWebCrawler(config=browser_config) as crawler:
-            # 深度爬取站点，并处理每个页面
-            visited_urls = set()
-            for start_url in site_config['start_urls']:
-                # 为每个起始URL执行爬取
-                result = await crawler.arun(
-                    url=start_url,
-                    config=run_config
-                )
-                
-                # 处理当前页面
-                url = start_url
-                if not database.url_exists(url):
-                    items_processed += 1
-                    
-                    # 从HTML中提取所需信息
-                    html_content = result.html
-                    parsed_data = parse_content_with_bs(html_content, site_config['selectors'])
-                    
-                    if parsed_data.get('title'):
-                        # 使用crawl4ai提取的markdown内容进行NLP处理
-                        text_for_nlp = result.markdown.raw_markdown or parsed_data.get('cleaned_content', html_content)
-                        nlp_results = nlp_processor.process_text(text_for_nlp)
-                        
-                        # 准备数据库数据
-                        db_data = {
-                            'title': parsed_data['title'],
-                            'source_url': url,
-                            'publication_date': parsed_data.get('publication_date', 'N/A'),
-                            'raw_content': html_content,
-                            'summary': nlp_results['summary'],
-                            'keywords': nlp_results['keywords'],
-                            'source_site': site_key,
-                            'category': nlp_results['category']
-                        }
-                        
-                        # 添加到数据库
-                        if database.add_briefing(db_data):
-                            items_added += 1
-                        else:
-                            items_skipped += 1
-                    else:
-                        logging.warning(f"无法为{url}提取标题。跳过。")
-                        items_skipped += 1
-                else:
-                    items_skipped += 1
-                
-                visited_urls.add(url)
-                
-                # 爬取页面中的链接
-                # 注意：此处我们可以使用crawl4ai的deep crawl功能，但为了更好的控制，
-                # 我们实现了一个简单的自定义链接爬取
-                if 'links' in result.__dict__:
-                    for link in result.links:
-                        link_url = link.get('href')
-                        if link_url and link_url not in visited_urls:
-                            # 检查链接是否在允许的域内并匹配文章模式
-                            is_allowed_domain = any(domain in link_url for domain in site_config['allowed_domains'])
-                            pattern = site_config.get('article_url_pattern')
-                            is_article = not pattern or pattern in link_url
-                            
-                            if is_allowed_domain and is_article:
-                                # 爬取链接页面
-                                link_result = await crawler.arun(
-                                    url=link_url,
-                                    config=run_config
-                                )
-                                
-                                if not database.url_exists(link_url):
-                                    items_processed += 1
-                                    
-                                    # 从HTML中提取所需信息
-                                    link_html = link_result.html
-                                    link_parsed_data = parse_content_with_bs(link_html, site_config['selectors'])
-                                    
-                                    if link_parsed_data.get('title'):
-                                        # 使用crawl4ai提取的markdown内容进行NLP处理
-                                        link_text_for_nlp = link_result.markdown.raw_markdown or link_parsed_data.get('cleaned_content', link_html)
-                                        link_nlp_results = nlp_processor.process_text(link_text_for_nlp)
-                                        
-                                        # 准备数据库数据
-                                        link_db_data = {
-                                            'title': link_parsed_data['title'],
-                                            'source_url': link_url,
-                                            'publication_date': link_parsed_data.get('publication_date', 'N/A'),
-                                            'raw_content': link_html,
-                                            'summary': link_nlp_results['summary'],
-                                            'keywords': link_nlp_results['keywords'],
-                                            'source_site': site_key,
-                                            'category': link_nlp_results['category']
-                                        }
-                                        
-                                        # 添加到数据库
-                                        if database.add_briefing(link_db_data):
-                                            items_added += 1
-                                        else:
-                                            items_skipped += 1
-                                    else:
-                                        logging.warning(f"无法为{link_url}提取标题。跳过。")
-                                        items_skipped += 1
-                                else:
-                                    items_skipped += 1
-                                
-                                visited_urls.add(link_url)
-                                
-                                # 限制每个起始URL抓取的链接数
-                                if len(visited_urls) >= 10:  # 可在配置中设置
-                                    break
-        
-        logging.info(f"站点{site_key}处理完成。处理：{items_processed}，添加：{items_added}，跳过：{items_skipped}")
-        return items_processed, items_added, items_skipped
-                
+        frontier.resume()
+        start_page_checks = {}
+        for start_url in site_config['start_urls']:
+            if start_url in frontier:
+                continue  # 中断前已处理过的起始页
+            # 渲染之前先用条件请求检查起始页，未变化时跳过渲染和链接遍历
+            state = probe = None
+            if CONDITIONAL_FETCH_ENABLED:
+                state = database.get_crawl_state(start_url)
+                probe = await asyncio.to_thread(probe_start_page, start_url, state)
+                if start_page_unchanged(state, probe, site_config):
+                    logging.info(f"起始页{start_url}未变化，跳过渲染和链接遍历。")
+                    database.touch_crawl_state(start_url, probe['etag'], probe['last_modified'])
+                    frontier.add_seed(start_url)
+                    frontier.mark(start_url, 'skipped')
+                    continue
+            start_page_checks[start_url] = (state, probe)
+            frontier.add_seed(start_url)
+
+        rendered_start_pages = {}
+        while frontier.fetched < max_pages:
+            if lease_lost is not None and lease_lost.is_set():
+                return _abort_lost_lease(site_key)
+            batch = frontier.pop(min(CRAWL_CONCURRENCY_PER_SITE, max_pages - frontier.fetched))
+            if not batch:
+                break
+
+            # 并发抓取一批页面，结果按优先级顺序送入流水线
+            results = await session.fetch_many([url for url, _ in batch], site_key=site_key)
+            for (url, depth), result in zip(batch, results):
+                await pipeline.submit(site_key, site_config, url, result)
+                succeeded = result is not None and getattr(result, 'success', True)
+                if succeeded:
+                    if depth == 0 and CONDITIONAL_FETCH_ENABLED:
+                        rendered_start_pages[url] = result
+                    frontier.add_links(_iter_link_urls(result), depth + 1)
+                frontier.mark(url, 'done' if succeeded else 'failed')
+
+        if lease_lost is not None and lease_lost.is_set():
+            return _abort_lost_lease(site_key)
+        # 起始页的抓取状态在清空队列之前记录，此时才知道页面上的哪些链接已经抓取
+        for url, result in rendered_start_pages.items():
+            state, probe = start_page_checks.get(url, (None, None))
+            statuses = database.frontier_statuses(site_key, _iter_link_urls(result))
+            save_start_page_state(
+                url, result, site_config, state, probe,
+                lambda link: link in pipeline.known_urls or statuses.get(link) == 'done'
+            )
+        frontier.clear()
     except Exception as e:
-        logging.error(f"站点{site_key}的爬取或处理过程中出错: {e}", exc_info=True)
-        return items_processed, items_added, items_skipped
+        logging.error(f"站点{site_key}的爬取过程中出错: {e}", exc_info=True)
+        return str(e) or type(e).__name__
+    return None
+
+async def run_crawl_job_async(site_keys=None, lease_lost=None):
+    """异步执行爬取任务，site_keys为要爬取的站点，默认爬取所有站点。
+
+    lease_lost为可选的{站点: threading.Event}，事件被设置时中止该站点的爬取（见crawl_site）。
 
-async def run_crawl_job_async():
-    """异步执行爬取任务"""
+    返回({站点: [处理, 添加, 跳过]}, {出错的站点: 错误信息})。
+    """
     logging.info("开始crawl4ai爬取任务...")
+    started_at = site_schedule.utc_now()
+    start = time.perf_counter()
+    sites = {
+        site_key: site_config for site_key, site_config in POST_CRAWL_SELECTORS.items()
+        if site_keys is None or site_key in site_keys
+    }
     
     total_processed = 0
     total_added = 0
     total_skipped = 0
     
-    # 对所有站点执行顺序爬取
-    # 注意：可以使用asyncio.gather进行并行爬取，但可能导致资源过载
-    for site_key, site_config in POST_CRAWL_SELECTORS.items():
-        items_processed, items_added, items_skipped = await crawl_site(site_key, site_config)
-        
+    # 已入库的URL在任务开始时一次性加载，链接在抓取前即按此过滤
+    known_urls = database.KnownUrlIndex.load()
+    # 已入库简报的正文指纹，用于在NLP处理之前识别其他站点转载的同一篇文章
+    dedup_index = SimHashIndex.from_pairs(database.iter_simhashes()) if DEDUP_ENABLED else None
+
+    # 整个任务只启动一次浏览器，所有站点共享并行爬取，
+    # 同时在途的页面数受CRAWL_MAX_CONCURRENT_PAGES和CRAWL_CONCURRENCY_PER_DOMAIN限制；
+    # 抓取到的页面经流水线解析、NLP处理后入库
+    async with CrawlPipeline(known_urls, parse_content, dedup_index) as pipeline:
+        async with get_crawler_class()(config=build_browser_config()) as crawler:
+            session = CrawlSession(crawler, build_run_config(), timings=pipeline.timings)
+            errors = await asyncio.gather(*(
+                crawl_site(site_key, site_config, session, pipeline, lease_lost=(lease_lost or {}).get(site_key))
+                for site_key, site_config in sites.items()
+            ))
+    site_errors = {site_key: error for site_key, error in zip(sites, errors) if error is not None}
+
+    for site_key, (items_processed, items_added, items_skipped) in pipeline.site_counts.items():
+        logging.info(f"站点{site_key}处理完成。处理：{items_processed}，添加：{items_added}，跳过：{items_skipped}")
         total_processed += items_processed
         total_added += items_added
         total_skipped += items_skipped
     
     logging.info(f"爬取任务完成。总计处理：{total_processed}，添加：{total_added}，跳过：{total_skipped}")
 
-def run_crawl_job():
-    """为配置的站点运行crawl4ai爬取过程"""
-    try:
-        # 使用asyncio.run运行异步任务
-        asyncio.run(run_crawl_job_async())
-    except Exception as e:
-        logging.error(f"运行爬取任务时发生错误: {e}", exc_info=True)
-
-def start_scheduler():
-    """配置并启动调度器循环"""
-    logging.info(f"安排每{SCRAPE_INTERVAL_HOURS}小时运行一次爬取任务。")
-    schedule.every(SCRAPE_INTERVAL_HOURS).hours.do(run_crawl_job)
-
-    logging.info("运行初始爬取任务...")
-    run_crawl_job()  # 立即运行一次
-    logging.info("初始爬取任务完成。")
-
-    logging.info("启动调度器循环...")
-    while True:
-        schedule.run_pending()
-        time.sleep(60)
-
-def run_scheduler_in_thread():
-    """在单独的线程中运行调度器"""
-    scheduler_thread = threading.Thread(target=start_scheduler, daemon=True)
-    scheduler_thread.start()
-    logging.info("调度器在后台线程中启动。")
+    # 各阶段的调用次数和累计耗时随任务摘要一起写入数据库
+    stage_timings = pipeline.timings.snapshot()
+    logging.info(f"各阶段耗时: {stage_timings}")
+    database.save_crawl_job_stats({
+        'started_at': site_schedule.format_time(started_at),
+        'finished_at': site_schedule.format_time(site_schedule.utc_now()),
+        'duration_seconds': round(time.perf_counter() - start, 3),
+        'processed': total_processed,
+        'added': total_added,
+        'skipped': total_skipped,
+        'site_counts': pipeline.site_counts,
+        'stage_timings': stage_timings
+    })
+    return pipeline.site_counts, site_errors
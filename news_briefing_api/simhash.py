@@ -0,0 +1,94 @@
+import hashlib
+import re
+from collections import Counter
+
+from config import DEDUP_MAX_DISTANCE, NLP_MAX_INPUT_CHARS
+
+FINGERPRINT_BITS = 64
+
+_TOKEN = re.compile(r'[㐀-䶿一-鿿豈-﫿]|[a-z0-9]+')
+
+def _shingles(text, size=3):
+    """把文本切成词（英文按单词，中文按单字），返回连续size个词组成的片段"""
+    tokens = _TOKEN.findall(text.lower())
+    if len(tokens) < size:
+        return [" ".join(tokens)] if tokens else []
+    return [" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)]
+
+def simhash(text, max_chars=NLP_MAX_INPUT_CHARS):
+    """计算文本的64位SimHash指纹，内容相近的文本指纹的汉明距离也小"""
+    features = Counter(_shingles((text or "")[:max_chars]))
+    weights = [0] * FINGERPRINT_BITS
+    for feature, count in features.items():
+        value = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(FINGERPRINT_BITS):
+            if value >> bit & 1:
+                weights[bit] += count
+            else:
+                weights[bit] -= count
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+class SimHashIndex:
+    """按分段查找近似重复指纹的内存索引。
+
+    把64位指纹分成max_distance+1段，汉明距离不超过max_distance的两个指纹至少有一段完全相同，
+    所以只需比较至少一段相同的候选，而不必和所有指纹逐一比较。
+    """
+
+    def __init__(self, max_distance=DEDUP_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.band_count = max_distance + 1
+        self.band_bits = FINGERPRINT_BITS // self.band_count
+        self._band_mask = (1 << self.band_bits) - 1
+        self._bands = [{} for _ in range(self.band_count)]
+        self._size = 0
+
+    @classmethod
+    def from_pairs(cls, pairs, max_distance=DEDUP_MAX_DISTANCE):
+        """从(键, 指纹)序列构建索引"""
+        index = cls(max_distance)
+        for key, fingerprint in pairs:
+            index.add(key, fingerprint)
+        return index
+
+    def _band_values(self, fingerprint):
+        for band in range(self.band_count):
+            yield band, fingerprint >> (band * self.band_bits) & self._band_mask
+
+    def add(self, key, fingerprint):
+        for band, value in self._band_values(fingerprint):
+            self._bands[band].setdefault(value, []).append((key, fingerprint))
+        self._size += 1
+
+    def remove(self, key, fingerprint):
+        """删除用add登记的键和指纹"""
+        removed = False
+        for band, value in self._band_values(fingerprint):
+            entries = self._bands[band].get(value)
+            if entries and (key, fingerprint) in entries:
+                entries.remove((key, fingerprint))
+                removed = True
+                if not entries:
+                    del self._bands[band][value]
+        if removed:
+            self._size -= 1
+
+    def find(self, fingerprint):
+        """返回(键, 汉明距离)：距离不超过max_distance且最近的已有指纹，没有时返回None"""
+        best = None
+        for band, value in self._band_values(fingerprint):
+            for key, candidate in self._bands[band].get(value, ()):
+                distance = hamming_distance(fingerprint, candidate)
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (key, distance)
+        return best
+
+    def __len__(self):
+        return self._size
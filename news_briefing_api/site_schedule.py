@@ -0,0 +1,91 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+from config import (
+    SCRAPE_INTERVAL_HOURS, SITE_INTERVAL_MIN_HOURS, SITE_INTERVAL_MAX_HOURS,
+    SCHEDULE_TARGET_ITEMS_PER_RUN, SCHEDULE_RATE_SMOOTHING, SCHEDULE_JITTER_RATIO
+)
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def utc_now():
+    """返回与SQLite的CURRENT_TIMESTAMP一致的不带时区的UTC时间"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def format_time(moment):
+    return moment.strftime(TIMESTAMP_FORMAT)
+
+def parse_time(value):
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+def due_sites(site_keys, states, now=None):
+    """返回已到爬取时间的站点，没有调度记录的新站点立即到期"""
+    now = now or utc_now()
+    return [
+        site_key for site_key in site_keys
+        if site_key not in states or parse_time(states[site_key]['next_run_at']) <= now
+    ]
+
+def next_site_state(site_key, state, items_added, page_budget, now=None):
+    """根据本次爬取新增的文章数更新站点的调度状态。
+
+    发布速率按“新增条数 / 距上次爬取的小时数”做指数平滑估计，
+    下次间隔取期望每次发现SCHEDULE_TARGET_ITEMS_PER_RUN篇新文章所需的时间，
+    每次最多延长一倍，并限制在SITE_INTERVAL_MIN_HOURS和SITE_INTERVAL_MAX_HOURS之间；
+    新增条数达到页面预算时说明还有积压，间隔至少缩短一半。
+    下次爬取时间加入随机浮动，避免多个站点长期集中在同一时刻。
+    """
+    now = now or utc_now()
+    if state is None:
+        elapsed_hours = SCRAPE_INTERVAL_HOURS
+        previous_rate = None
+        previous_interval = SCRAPE_INTERVAL_HOURS
+    else:
+        elapsed_hours = (now - parse_time(state['last_run_at'])).total_seconds() / 3600
+        previous_rate = state['rate_per_hour']
+        previous_interval = state['interval_hours']
+    elapsed_hours = max(elapsed_hours, SITE_INTERVAL_MIN_HOURS / 60)
+
+    sample_rate = items_added / elapsed_hours
+    if previous_rate is None:
+        rate = sample_rate
+    else:
+        rate = SCHEDULE_RATE_SMOOTHING * sample_rate + (1 - SCHEDULE_RATE_SMOOTHING) * previous_rate
+
+    interval = SCHEDULE_TARGET_ITEMS_PER_RUN / rate if rate > 0 else SITE_INTERVAL_MAX_HOURS
+    # 每次最多延长一倍，偶尔一次没有新文章不会让站点立即降到最低频率
+    interval = min(interval, previous_interval * 2)
+    if page_budget and items_added >= page_budget - 1:
+        interval = min(interval, previous_interval / 2)
+    interval = min(max(interval, SITE_INTERVAL_MIN_HOURS), SITE_INTERVAL_MAX_HOURS)
+
+    jitter = random.uniform(1 - SCHEDULE_JITTER_RATIO, 1 + SCHEDULE_JITTER_RATIO)
+    return {
+        'site_key': site_key,
+        'rate_per_hour': rate,
+        'interval_hours': interval,
+        'last_run_at': format_time(now),
+        'next_run_at': format_time(now + timedelta(hours=interval * jitter))
+    }
+
+def postponed_site_state(site_key, state, now=None):
+    """爬取任务失败时保留原有估计，在最短间隔后重试"""
+    now = now or utc_now()
+    return {
+        'site_key': site_key,
+        'rate_per_hour': state['rate_per_hour'] if state else 0.0,
+        'interval_hours': state['interval_hours'] if state else SCRAPE_INTERVAL_HOURS,
+        'last_run_at': state['last_run_at'] if state else format_time(now),
+        'next_run_at': format_time(now + timedelta(hours=SITE_INTERVAL_MIN_HOURS))
+    }
+
+def fixed_site_state(site_key, state, now=None):
+    """未启用自适应调度时，每个站点固定每SCRAPE_INTERVAL_HOURS小时爬取一次"""
+    now = now or utc_now()
+    return {
+        'site_key': site_key,
+        'rate_per_hour': state['rate_per_hour'] if state else 0.0,
+        'interval_hours': SCRAPE_INTERVAL_HOURS,
+        'last_run_at': format_time(now),
+        'next_run_at': format_time(now + timedelta(hours=SCRAPE_INTERVAL_HOURS))
+    }
@@ -0,0 +1,62 @@
+"""只运行爬取任务的入口，与API服务分开部署。
+
+    python worker.py                      # 持续运行：定期把到期站点加入任务队列，并领取任务爬取
+    python worker.py --once               # 处理完队列中当前可领取的任务后退出，适合由cron等外部调度器启动
+    python worker.py --metrics-port 9100  # 同时在该端口的/metrics上输出本进程的指标
+
+可以在多台机器或同一台机器上运行多个worker，它们通过数据库中的任务队列协调。
+"""
+import argparse
+import logging
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import database
+import job_queue
+from metrics import REGISTRY
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """以Prometheus文本格式输出worker进程的抓取、解析、NLP和入库指标"""
+
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # 不为每次抓取指标记录访问日志
+
+def start_metrics_server(port, host='0.0.0.0'):
+    """在后台线程中启动指标服务"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"worker指标服务已启动: http://{host}:{server.server_port}/metrics")
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="运行爬取任务")
+    parser.add_argument('--once', action='store_true', help="处理完当前可领取的任务后退出")
+    parser.add_argument('--worker-id', help="worker标识，默认为主机名:进程号")
+    parser.add_argument('--metrics-port', type=int, help="在该端口输出/metrics指标")
+    args = parser.parse_args(argv)
+
+    try:
+        database.init_db()
+    except Exception as e:
+        logging.critical(f"初始化数据库失败: {e}. 退出。")
+        return 1
+
+    if args.metrics_port is not None:
+        start_metrics_server(args.metrics_port)
+    job_queue.run_worker(args.worker_id, once=args.once)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())